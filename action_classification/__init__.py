@@ -1 +1,2 @@
+from action_classification import taxonomy
 from action_classification import action_classification
@@ -1,6 +1,18 @@
+from action_classification import taxonomy
+import hashlib
+import numpy as np
+import pandas as pd
+from functools import lru_cache
+from typing import List, Sequence, Tuple, Union
+
+# Upper bound on the number of distinct descriptions memoized by classify
+TAB_CACHE_SIZE = 4096
+
+
 def classify_design_space(action: str) -> int:
     """
-    The returning index corresponds to the list stored in "count":
+    The returning index corresponds to the list stored in "count", as defined in
+    taxonomies/design_space.json:
     [sketching, 3D features, mating, visualizing, browsing, other organizing]
 
     Formulas for each design space action:
@@ -19,41 +31,15 @@ def classify_design_space(action: str) -> int:
             belong to any category, return -1
 
             Note:   "Add or modify a sketch" is special (+1 for sketching and -1 for 3D features),
-                    return -10
-    """
-    # Creating a sketch is special as it affects both the sketching and the 3D features counts
-    if action == "Add or modify a sketch":
-        return -10
-    # Sketching
-    elif action == "Copy paste sketch":
-        return 0
-    # 3D features
-    elif action in ["Commit add or edit of part studio feature",
-                    "Delete part studio feature"]:
-        return 1
-    # Mating
-    elif action in ["Add assembly feature", "Delete assembly feature", "Add assembly instance"
-                    "Delete assembly instance"]:
-        return 2
-    # Visualizing
-    elif action in ["Start assembly drag", "Animate action called"]:
-        return 3
-    # Browsing
-    elif "Tab" in action and ("opened" in action or "created" in action or "deleted" in action or
-                              "renamed" in action):
-        return 4
-    # Other organizing
-    elif action in ["Create version", "Cancel Operation", "Undo Redo Operation", "Merge branch",
-                    "Branch workspace", "Update version"]:
-        return 5
-    # Not classified (Optional: print out the unclassified actions)
-    else:
-        return -1
+                    return -10, a composite code of the taxonomy (see increments)
+    """
+    return classify(action)[0]
 
 
 def classify_action_type(action: str) -> int:
     """
-    The returning index corresponds to the list stored in "count":
+    The returning index corresponds to the list stored in "count", as defined in
+    taxonomies/action_type.json:
     [creating, editing, deleting, revising, viewing, other]
 
     Formulas for each design space action:
@@ -72,29 +58,95 @@ def classify_action_type(action: str) -> int:
     :return: the index of the action type that this action is accounted for; if the action does not
             belong to any category, return -1
     """
-    # Creating
-    if action in ["Add part studio feature", "Add assembly feature", "Add assembly instance",
-                  "Copy paste sketch"]:
-        return 0
-    # Editing
-    elif action in ["Start edit of part studio feature", "Start edit of assembly feature",
-                    "Set mate values"]:
-        return 1
-    # Deleting
-    elif action in ["Delete part studio feature", "Delete assembly feature",
-                    "Delete assembly instance"]:
-        return 2
-    # Revising
-    elif action in ["Cancel Operation", "Undo Redo Operation"]:
-        return 3
-    # Viewing
-    elif action == "Animate action called" or ("Tab" in action and "opened" in action):
-        return 4
-    # Other
-    elif action in ["Create version", "Merge branch", "Branch workspace", "Update version"] \
-            or ("Tab" in action and
-                ("created" in action or "deleted" in action or "renamed" in action)):
-        return 5
-    # Not classified (Optional: print out the unclassified actions)
-    else:
-        return -1
+    return classify(action)[1]
+
+
+def taxonomy_version() -> str:
+    """
+    Fingerprint of the classification rules, used to invalidate counts computed (e.g., cached) with
+    other versions of the rules. Any edit to the taxonomy definitions or to the modules compiling
+    and applying them changes the fingerprint.
+    :return: a short hexadecimal digest of the classification rules
+    """
+    digest = hashlib.sha256()
+    for path in [__file__, taxonomy.__file__] + [definition.source for definition in TAXONOMIES]:
+        with open(path, 'rb') as rules:
+            digest.update(rules.read())
+    return digest.hexdigest()[:16]
+
+
+# The design space and the action type taxonomies, defined in taxonomies/*.json
+TAXONOMIES = taxonomy.default_taxonomies()
+
+# Both taxonomies compiled together, so that each action is matched once for both
+_MATCHER = taxonomy.TaxonomyMatcher(TAXONOMIES, cache_size=TAB_CACHE_SIZE)
+_classify = _MATCHER.classify
+
+
+def classify(action: str) -> Tuple[int, ...]:
+    """
+    Classify an action with every classification method in a single call. Equivalent to
+    (classify_design_space(action), classify_action_type(action)) with the default taxonomies.
+    :param action: the action to be classified
+    :return: the code of the action in each taxonomy of TAXONOMIES, e.g., the (design space index,
+            action type index) pair; see classify_design_space and classify_action_type for the
+            meaning of each index
+    """
+    return _classify(action)
+
+
+def classify_batch(actions: Union[pd.Series, np.ndarray]) -> Tuple[np.ndarray, ...]:
+    """
+    Classify a whole column of actions with every classification method, each distinct action once
+    (see TaxonomyMatcher.classify_batch).
+    :param actions: the actions to be classified (e.g., the Description column of an audit trail)
+    :return: one integer array per taxonomy of TAXONOMIES, of the same length as actions, holding
+            the code of each action (-1 for missing or unclassified actions), e.g., the design space
+            index and the action type index of each action
+    """
+    return _MATCHER.classify_batch(actions)
+
+
+# The codes of an action classified in no taxonomy
+UNCLASSIFIED = (-1,) * len(TAXONOMIES)
+
+
+def new_count() -> List[List[int]]:
+    """
+    Create a fresh (never shared) nested list of zero counts, one list per taxonomy of TAXONOMIES
+    with one count per category: [[0, 0, 0, 0, 0, 0], [0, 0, 0, 0, 0, 0]] by default.
+    """
+    return [[0] * len(definition.categories) for definition in TAXONOMIES]
+
+
+@lru_cache(maxsize=None)  # bounded by the number of combinations of rules
+def increments(codes: Tuple[int, ...]) -> Tuple[Tuple[int, int, int], ...]:
+    """
+    The changes to the counts of an action, applying the weights of composite codes (e.g., the
+    special "Add or modify a sketch" action adds 1 to sketching and -1 to 3D features).
+    :param codes: the codes of the action in each taxonomy (from classify)
+    :return: the (taxonomy index, category index, weight) of every count to be updated
+    """
+    return tuple((i, category, weight)
+                 for i, (definition, code) in enumerate(zip(TAXONOMIES, codes))
+                 for category, weight in definition.increments(code))
+
+
+def tally(key_codes: np.ndarray, n_keys: int, codes: Sequence[np.ndarray]) -> List[np.ndarray]:
+    """
+    Sum classified actions per key in every taxonomy, with vectorized bin counts.
+    :param key_codes: the key (e.g., file or user) index of each action, between 0 and n_keys - 1
+    :param n_keys: the number of distinct keys
+    :param codes: the codes of the actions, one array per taxonomy (from classify_batch)
+    :return: one integer array of shape (n_keys, number of categories) per taxonomy
+    """
+    return [definition.tally_by(key_codes, n_keys, taxonomy_codes)
+            for definition, taxonomy_codes in zip(TAXONOMIES, codes)]
+
+
+def classified(codes: Sequence[np.ndarray]) -> np.ndarray:
+    """
+    :param codes: the codes of the actions, one array per taxonomy (from classify_batch)
+    :return: a boolean array, True for the actions classified in at least one taxonomy
+    """
+    return np.any([taxonomy_codes != -1 for taxonomy_codes in codes], axis=0)
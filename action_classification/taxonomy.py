@@ -0,0 +1,291 @@
+from instrumentation import instrumentation
+import json
+import os
+import numpy as np
+import pandas as pd
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Sequence, Tuple, Union
+
+# Directory of the taxonomies shipped with the package (one JSON file per taxonomy)
+TAXONOMY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "taxonomies")
+
+# Code of the first composite outcome (e.g., the +1/-1 sketch case); the next ones count down
+COMPOSITE_CODE = -10
+
+# Default upper bound on the number of distinct non-exact actions memoized by a TaxonomyMatcher
+CACHE_SIZE = 4096
+
+# Marker framing a description before it is scanned, so that prefix rules are substring patterns
+_START = "\x02"
+
+_CONDITIONS = ("exact", "prefix", "contains", "contains_any")
+
+
+class Taxonomy(NamedTuple):
+    """
+    A classification method, loaded from its JSON definition (see load_taxonomy). Rules are tried
+    in order and the first matching rule classifies the action.
+    """
+    name: str
+    categories: List[str]
+    rules: List[Dict]  # the rule definitions, with "weights" normalized to category indices
+    composite: List[Tuple[int, ...]]  # weights of codes COMPOSITE_CODE, COMPOSITE_CODE - 1, ...
+    source: str  # the path of the definition
+
+    def code(self, rule: Dict) -> int:
+        """
+        The code an action matched by a rule is classified with: the index of its category, or a
+        code from COMPOSITE_CODE down for rules with any other weights.
+        """
+        weights = rule["weights"]
+        if len(weights) == 1 and list(weights.values())[0] == 1:
+            return list(weights)[0]
+        vector = tuple(weights.get(i, 0) for i in range(len(self.categories)))
+        return COMPOSITE_CODE - self.composite.index(vector)
+
+    def weights(self) -> np.ndarray:
+        """
+        The weights of every code, one row per category code, then one per composite code from
+        COMPOSITE_CODE down, then a last row of zeros for unclassified actions (-1).
+        :return: an integer array of shape (len(categories) + len(composite) + 1, len(categories))
+        """
+        return np.concatenate([np.eye(len(self.categories), dtype=np.int64),
+                               np.array(self.composite, dtype=np.int64).reshape(
+                                   -1, len(self.categories)),
+                               np.zeros((1, len(self.categories)), dtype=np.int64)])
+
+    def weight_rows(self, codes: np.ndarray) -> np.ndarray:
+        """
+        The row of weights (see weights) of every code.
+        :param codes: the codes of the actions (from TaxonomyMatcher.classify_batch)
+        :return: an integer array of the same shape as codes
+        """
+        codes = np.asarray(codes, dtype=np.int64)
+        return np.where(codes >= 0, codes, np.where(
+            codes <= COMPOSITE_CODE, len(self.categories) + COMPOSITE_CODE - codes,
+            len(self.categories) + len(self.composite)))
+
+    def increments(self, code: int) -> List[Tuple[int, int]]:
+        """
+        The (category index, weight) pairs an action classified with code adds to the counts.
+        """
+        if code >= 0:
+            return [(code, 1)]
+        if code <= COMPOSITE_CODE:
+            return [(i, weight) for i, weight in enumerate(self.composite[COMPOSITE_CODE - code])
+                    if weight]
+        return []
+
+    def tally_by(self, key_codes: np.ndarray, n_keys: int, codes: np.ndarray) -> np.ndarray:
+        """
+        Count classified actions per key and per category, applying the weights of composite codes,
+        with a single bin count of the (key, code) pairs.
+        :param key_codes: the key index of each action, between 0 and n_keys - 1
+        :param n_keys: the number of distinct keys
+        :param codes: the codes of the actions (from TaxonomyMatcher.classify_batch)
+        :return: the (signed) counts, of shape (n_keys, len(categories))
+        """
+        weights = self.weights()
+        pairs = np.asarray(key_codes, dtype=np.int64) * len(weights) + self.weight_rows(codes)
+        return np.bincount(pairs, minlength=n_keys * len(weights)).reshape(
+            n_keys, len(weights)) @ weights
+
+    def tally(self, codes: np.ndarray) -> np.ndarray:
+        """
+        Count classified actions per category, applying the weights of composite codes.
+        :param codes: the codes of the actions (from TaxonomyMatcher.classify_batch)
+        :return: the (signed) count of each category
+        """
+        codes = np.asarray(codes)
+        return self.tally_by(np.zeros(len(codes), dtype=np.int64), 1, codes)[0]
+
+
+def load_taxonomy(path: str) -> Taxonomy:
+    """
+    Load a taxonomy from its JSON definition:
+        {"name": ..., "categories": [...], "rules": [...]}
+    where each rule has one or more conditions, all of which must hold:
+        "exact": [...]          the action is one of these strings
+        "prefix": [...]         the action starts with one of these strings
+        "contains": [...]       the action contains all of these strings
+        "contains_any": [...]   the action contains at least one of these strings
+    and either "category" (counted +1) or signed "weights" per category name, e.g.
+        {"exact": ["Add or modify a sketch"], "weights": {"Sketching": 1, "3D Features": -1}}
+    :param path: the path of the JSON file
+    :return: the taxonomy
+    """
+    with open(path) as definition:
+        data = json.load(definition)
+    categories = list(data["categories"])
+    rules, composite = [], []
+    for number, rule in enumerate(data["rules"]):
+        where = "%s: rule %d" % (path, number)
+        unknown = set(rule) - set(_CONDITIONS) - {"category", "weights"}
+        if unknown:
+            raise ValueError("%s: unknown keys %s" % (where, sorted(unknown)))
+        if not any(rule.get(condition) for condition in _CONDITIONS):
+            raise ValueError("%s: no condition" % where)
+        weights = rule.get("weights", {rule.get("category"): 1})
+        if set(weights) - set(categories):
+            raise ValueError("%s: unknown categories %s" % (where, sorted(set(weights) -
+                                                                          set(categories))))
+        normalized = {condition: list(rule[condition]) for condition in _CONDITIONS
+                      if rule.get(condition)}
+        normalized["weights"] = {categories.index(category): weight
+                                 for category, weight in weights.items() if weight}
+        rules.append(normalized)
+        vector = tuple(normalized["weights"].get(i, 0) for i in range(len(categories)))
+        if sorted(vector) != [0] * (len(vector) - 1) + [1] and vector not in composite:
+            composite.append(vector)
+    return Taxonomy(data["name"], categories, rules, composite, path)
+
+
+def default_taxonomies() -> List[Taxonomy]:
+    """
+    :return: the design space and the action type taxonomies, in this order
+    """
+    return [load_taxonomy(os.path.join(TAXONOMY_DIR, name + ".json"))
+            for name in ("design_space", "action_type")]
+
+
+class _Automaton:
+    """
+    Aho-Corasick automaton finding every occurrence of a set of patterns in a single pass over a
+    text, whatever the number of patterns.
+    """
+    __slots__ = ("goto", "fail", "output")
+
+    def __init__(self, patterns: Sequence[str]):
+        self.goto = [{}]
+        self.output = [0]  # bit i is set if pattern i ends at this state
+        for i, pattern in enumerate(patterns):
+            state = 0
+            for character in pattern:
+                if character not in self.goto[state]:
+                    self.goto.append({})
+                    self.output.append(0)
+                    self.goto[state][character] = len(self.goto) - 1
+                state = self.goto[state][character]
+            self.output[state] |= 1 << i
+        # Breadth-first, so that the failure state of every state is computed before its children
+        self.fail = [0] * len(self.goto)
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for character, child in self.goto[state].items():
+                fallback = self.fail[state]
+                while fallback and character not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(character, 0)
+                self.output[child] |= self.output[self.fail[child]]
+                queue.append(child)
+
+    def scan(self, text: str) -> int:
+        """
+        :return: the set of patterns found in text, as a bit mask
+        """
+        goto, fail, output = self.goto, self.fail, self.output
+        state = found = 0
+        for character in text:
+            while state and character not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(character, 0)
+            found |= output[state]
+        return found
+
+
+class TaxonomyMatcher:
+    """
+    Several taxonomies compiled together: a hash table holds the codes of every exact-match action,
+    and a single automaton over the patterns of every prefix/substring rule classifies the other
+    actions, so that each action is scanned once whatever the number of taxonomies and rules.
+    Results are memoized in a bounded LRU cache, since the same descriptions recur in audit trails
+    (tab descriptions, which embed tab and user names, are the only unbounded ones).
+    """
+
+    def __init__(self, taxonomies: Sequence[Taxonomy], cache_size=CACHE_SIZE):
+        self.taxonomies = list(taxonomies)
+        self.classify = lru_cache(maxsize=cache_size)(self._classify)
+        patterns = []
+
+        def mask(strings: List[str], prefix="") -> int:
+            bits = 0
+            for string in strings:
+                if prefix + string not in patterns:
+                    patterns.append(prefix + string)
+                bits |= 1 << patterns.index(prefix + string)
+            return bits
+
+        # Per taxonomy, the (all, any, prefix any, code) masks of each rule with patterns, in order
+        self._pattern_rules = []
+        for taxonomy in self.taxonomies:
+            self._pattern_rules.append([
+                (mask(rule.get("contains", [])), mask(rule.get("contains_any", [])),
+                 mask(rule.get("prefix", []), _START), taxonomy.code(rule))
+                for rule in taxonomy.rules if "exact" not in rule])
+        self._automaton = _Automaton(patterns)
+        # Exact actions are classified once here, with every rule, so that rule order is preserved
+        self.exact = {action: self._classify_slow(action)
+                      for taxonomy in self.taxonomies for rule in taxonomy.rules
+                      for action in rule.get("exact", [])}
+
+    def _classify_slow(self, action: str) -> Tuple[int, ...]:
+        codes = []
+        for taxonomy in self.taxonomies:
+            for rule in taxonomy.rules:
+                if ("exact" not in rule or action in rule["exact"]) and \
+                        ("prefix" not in rule or action.startswith(tuple(rule["prefix"]))) and \
+                        all(pattern in action for pattern in rule.get("contains", [])) and \
+                        ("contains_any" not in rule or
+                         any(pattern in action for pattern in rule["contains_any"])):
+                    codes.append(taxonomy.code(rule))
+                    break
+            else:
+                codes.append(-1)
+        return tuple(codes)
+
+    def _classify(self, action: str) -> Tuple[int, ...]:
+        """
+        Classify an action with every taxonomy (memoized as classify).
+        :param action: the action to be classified
+        :return: the code of the action in each taxonomy (-1 if unclassified)
+        """
+        codes = self.exact.get(action)
+        if codes is not None:
+            return codes
+        return self._scan(action)
+
+    def _scan(self, action: str) -> Tuple[int, ...]:
+        found = self._automaton.scan(_START + action)
+        codes = []
+        for rules in self._pattern_rules:
+            for all_mask, any_mask, prefix_mask, code in rules:
+                if found & all_mask == all_mask and (not any_mask or found & any_mask) and \
+                        (not prefix_mask or found & prefix_mask):
+                    codes.append(code)
+                    break
+            else:
+                codes.append(-1)
+        return tuple(codes)
+
+    def classify_batch(self, actions: Union[pd.Series, np.ndarray]) -> Tuple[np.ndarray, ...]:
+        """
+        Classify a whole column of actions with every taxonomy. The column is factorized into its
+        distinct actions, each distinct action is classified once, and the codes are broadcast
+        back to every row, so the cost scales with the number of distinct actions instead of rows.
+        :param actions: the actions to be classified (e.g., the Description column of an audit
+                        trail)
+        :return: one integer array per taxonomy, of the same length as actions, holding the code
+                of each action (-1 for missing or unclassified actions)
+        """
+        with instrumentation.stage("classify", rows=len(actions)):
+            row_codes, uniques = pd.factorize(np.asarray(actions, dtype=object))
+            # One extra trailing row absorbs the -1 codes factorize assigns to missing values
+            codes = np.full((len(uniques) + 1, len(self.taxonomies)), -1, dtype=np.int64)
+            for i, action in enumerate(uniques):
+                codes[i] = self.classify(str(action).strip())
+            histogram = instrumentation.unclassified_histogram()
+            if histogram is not None:
+                rows = np.bincount(row_codes[row_codes >= 0], minlength=len(uniques))
+                for i in np.flatnonzero((codes[:-1] == -1).all(axis=1)):
+                    histogram[str(uniques[i]).strip()] += int(rows[i])
+            return tuple(codes[row_codes, i] for i in range(len(self.taxonomies)))
@@ -0,0 +1,115 @@
+from action_count_plotting import plotting
+from instrumentation import instrumentation
+import io
+import os
+import inspect
+import matplotlib
+from matplotlib.figure import Figure
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Plotting functions available for batch rendering, by name
+PLOTS = {"design_space_percentage": plotting.design_space_percentage,
+         "action_type_percentage": plotting.action_type_percentage,
+         "cr_ratio": plotting.cr_ratio,
+         "plot_contribution": plotting.plot_contribution,
+         "activity_over_time": plotting.activity_over_time,
+         "collaboration_heatmap": plotting.collaboration_heatmap}
+
+
+def render_figure(plot: str, data: Any, fig_size: Optional[Tuple[float, float]] = None,
+                  figure: Optional[Figure] = None, **kwargs) -> Figure:
+    """
+    Draw a plot on a figure that is not managed by pyplot, so it is never displayed and is freed
+    as soon as it is no longer referenced.
+    :param plot: the name of the plotting function in PLOTS
+    :param data: the data passed to the plotting function (e.g., data read from Counts.csv)
+    :param fig_size: (Optional) specified figure size in (width, height); defaults to the default
+                        fig_size of the plotting function
+    :param figure: (Optional) a figure to be cleared and reused instead of creating a new one
+    :param kwargs: (Optional) other arguments of the plotting function (e.g., analyzing_category)
+    :return: the figure
+    """
+    function = PLOTS[plot]
+    if fig_size is None:
+        fig_size = inspect.signature(function).parameters["fig_size"].default
+    if figure is None:
+        figure = Figure(figsize=fig_size)
+    else:
+        figure.clear()
+        figure.set_size_inches(fig_size)
+    function(data, ax=figure.subplots(), **kwargs)
+    figure.tight_layout()
+    return figure
+
+
+def render(plot: str, data: Any, fmt="png", dpi: Optional[float] = None, **kwargs) -> bytes:
+    """
+    Render a plot to an image in memory instead of displaying it.
+    :param plot: the name of the plotting function in PLOTS
+    :param data: the data passed to the plotting function (e.g., data read from Counts.csv)
+    :param fmt: (Optional) the image format: "png", "svg", "pdf", ...
+    :param dpi: (Optional) the resolution of raster images
+    :param kwargs: (Optional) other arguments of render_figure and the plotting function
+    :return: the content of the image file
+    """
+    buffer = io.BytesIO()
+    figure = render_figure(plot, data, **kwargs)
+    with instrumentation.stage("save figure"):
+        figure.savefig(buffer, format=fmt, dpi=dpi)
+    return buffer.getvalue()
+
+
+# Figure reused by every rendering of a batch in the same process
+_batch_figure: Optional[Figure] = None
+
+
+def _render_file(plot: str, data: Any, path: str, kwargs: Dict) -> str:
+    """
+    Internal worker function rendering a plot to a file, reusing the figure of the process.
+    :return: the path of the file
+    """
+    global _batch_figure
+    _batch_figure = render_figure(plot, data, figure=_batch_figure, **kwargs)
+    with instrumentation.stage("save figure"):
+        _batch_figure.savefig(path)
+    return path
+
+
+def _use_agg() -> None:
+    matplotlib.use("Agg")
+
+
+def render_batch(tasks: Iterable[Tuple[str, Any, str, Dict]], processes=1) -> List[str]:
+    """
+    Render many plots to files without displaying them, e.g., for hundreds of reports per run.
+    Note: with processes > 1 on Windows and macOS, the calling script must be protected by
+    if __name__ == "__main__":.
+    :param tasks: (plot name in PLOTS, data, output path, other arguments of render_figure) of
+                    every plot; the extension of the path gives the format (png, svg, pdf, ...)
+    :param processes: (Optional) the number of worker processes rendering in parallel
+    :return: the paths of the rendered files
+    """
+    tasks = list(tasks)
+    for _, _, path, _ in tasks:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if processes <= 1:
+        return [_render_file(*task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=processes, initializer=_use_agg) as executor:
+        return list(instrumentation.map_workers(executor, _render_file, *zip(*tasks)))
+
+
+def render_report(df: Any, output_dir: str, plots=("design_space_percentage",
+                                                   "action_type_percentage", "cr_ratio"),
+                  formats=("png",), processes=1) -> List[str]:
+    """
+    Render several plots of one Counts table to files named after the plots.
+    :param df: data read from Counts.csv in pandas DataFrame
+    :param output_dir: the directory of the rendered files (created if missing)
+    :param plots: (Optional) the names of the plotting functions in PLOTS
+    :param formats: (Optional) the formats each plot is rendered in
+    :param processes: (Optional) the number of worker processes rendering in parallel
+    :return: the paths of the rendered files
+    """
+    return render_batch([(plot, df, os.path.join(output_dir, plot + "." + fmt), {})
+                         for plot in plots for fmt in formats], processes=processes)
@@ -1,12 +1,143 @@
+from action_classification import action_classification
+from action_counting import activity_series, collaboration
+from instrumentation import instrumentation
 import pandas as pd
 import numpy as np
-from typing import List, Tuple
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
 import matplotlib.pyplot as plt
 from matplotlib import ticker
+from matplotlib.axes import Axes
+from matplotlib.collections import PolyCollection
+from matplotlib.figure import Figure
+
+# Columns of Counts.csv following the name column, in the order of the count lists: the categories
+# of every taxonomy ("Sketching", ..., "Other Organizing", "Creating", ..., "Other")
+COUNT_COLUMNS = [category for definition in action_classification.TAXONOMIES
+                 for category in definition.categories]
+
+# Above this number of users, bars are drawn as one collection per category, without labels
+LABEL_THRESHOLD = 50
+
+
+def counts_to_frame(counts: Dict, name_column="File Name") -> pd.DataFrame:
+    """
+    Build the table stored in Counts.csv directly from counts (e.g., returned by
+    aggregate_count.aggregate_count or aggregate_count.aggregate_count_store), so that the plotting
+    functions can be used without writing and reading Counts.csv.
+    :param counts: a dictionary of counts in the format returned by aggregate_count
+    :param name_column: (Optional) the name of the first column, "File Name" or "User Name"
+    :return: data in pandas DataFrame, with one row per file/user and a "Total" column holding the
+            total count of actions classified in action type
+    """
+    names = list(counts)
+    data = np.array([sum(count, []) for count in counts.values()],
+                    dtype=np.int64).reshape(len(names), len(COUNT_COLUMNS))
+    df = pd.DataFrame(data, columns=COUNT_COLUMNS)
+    df.insert(0, name_column, names)
+    # The action type, the last taxonomy, classifies every counted action once
+    df["Total"] = data[:, -len(action_classification.TAXONOMIES[-1].categories):].sum(axis=1)
+    return df
+
+
+def _as_frame(df: Union[pd.DataFrame, Dict], name_column: str) -> pd.DataFrame:
+    """
+    Internal function accepting counts (e.g., the results of an audit_index query) wherever the
+    plotting functions expect the data of Counts.csv.
+    """
+    return counts_to_frame(df, name_column) if isinstance(df, dict) else df
+
+
+def _show(fig: Figure, save_fig: str) -> None:
+    """
+    Internal function laying out a figure created by a plotting function, then saving, showing and
+    (unless an interactive window displays it) closing it.
+    :param fig: the figure to be shown
+    :param save_fig: if not None, the plot will be saved with the specified name in png
+    """
+    fig.tight_layout()
+    if save_fig:
+        fig.savefig(save_fig + ".png")
+    plt.show()
+    # Non-interactive backends (e.g., Agg) display nothing: close the figure, which pyplot would
+    # otherwise keep until the end of the process
+    if fig.canvas.required_interactive_framework is None:
+        plt.close(fig)
+
+
+def _draw_figures(n_users: int, fig_size: Tuple[float], save_fig: str, ax: Optional[Axes],
+                  page_size: Optional[int], draw: Callable[[Axes, slice], None]) -> None:
+    """
+    Internal function drawing a plot of users on ax, or on new figures that are saved and shown.
+    With page_size, users are split into pages of page_size users, each on its own figure (saved
+    with the page number appended to save_fig).
+    :param n_users: the number of users (rows) to be plotted
+    :param fig_size: specified figure size in (width, height)
+    :param save_fig: if not None, the plot will be saved with the specified name in png
+    :param ax: if not None, all users are drawn on ax, which is neither saved nor shown
+    :param page_size: if not None, the maximum number of users per figure
+    :param draw: the function drawing the users in the given slice of rows on the given axes
+    """
+    if ax is not None:
+        draw(ax, slice(None))
+    elif page_size and n_users > page_size:
+        for page, first in enumerate(range(0, n_users, page_size), 1):
+            fig, ax = plt.subplots(figsize=fig_size)
+            draw(ax, slice(first, first + page_size))
+            _show(fig, save_fig and "{}_{}".format(save_fig, page))
+    else:
+        fig, ax = plt.subplots(figsize=fig_size)
+        draw(ax, slice(None))
+        _show(fig, save_fig)
+
+
+def _top_users(df: pd.DataFrame, name_column: str, columns: List[str],
+               top_n: Optional[int]) -> pd.DataFrame:
+    """
+    Internal function keeping the top_n users with the most actions in columns (in their original
+    order) and summing the counts of the other users in a final "Others" row.
+    :param df: data read from Counts.csv in pandas DataFrame
+    :param name_column: the name of the file/user name column of df
+    :param columns: the count columns to be kept and summed
+    :param top_n: the number of users to keep; if None, df is returned unchanged
+    :return: the data of the top users and others
+    """
+    if top_n is None or len(df) <= top_n:
+        return df
+    totals = df[columns].sum(axis=1).to_numpy()
+    top = np.sort(np.argsort(-totals, kind="stable")[:top_n])
+    others = np.ones(len(df), dtype=bool)
+    others[top] = False
+    others_row = df.loc[others, columns].sum().to_frame().T
+    others_row.insert(0, name_column, "Others")
+    return pd.concat([df.iloc[top][[name_column] + columns], others_row], ignore_index=True)
+
+
+def _bar_collection(positions: np.ndarray, starts: np.ndarray, lengths: np.ndarray, color,
+                    label: Optional[str], horizontal=True, thickness=0.8) -> PolyCollection:
+    """
+    Internal function building bars as a single collection, which is much faster to draw than one
+    rectangle per bar when there are thousands of bars.
+    :param positions: the centre of each bar on the category axis
+    :param starts: the value at which each bar starts
+    :param lengths: the length of each bar
+    :param color: the colour of the bars
+    :param label: the legend label of the bars
+    :param horizontal: (Optional) are the bars horizontal (as with barh) or vertical (as with bar)?
+    :param thickness: (Optional) the thickness of each bar
+    :return: the collection of bars, to be added to axes
+    """
+    low, high = positions - thickness / 2, positions + thickness / 2
+    ends = starts + lengths
+    vertices = np.stack([np.stack(corner, axis=-1) for corner in
+                         ((starts, low), (starts, high), (ends, high), (ends, low))], axis=1)
+    if not horizontal:
+        vertices = vertices[:, :, ::-1]
+    return PolyCollection(vertices, facecolors=color, linewidths=0, label=label)
 
 
 def _plot_percentage(df: pd.DataFrame, category_names: List[str], fig_size: Tuple[float],
-                     save_fig: str) -> None:
+                     save_fig: str, ax: Optional[Axes], top_n: Optional[int],
+                     page_size: Optional[int]) -> None:
     """
     Internal function for plotting percentages of actions spent between different categories in
     category_names.
@@ -14,77 +145,116 @@ def _plot_percentage(df: pd.DataFrame, category_names: List[str], fig_size: Tupl
     :param category_names: categories of actions being considered and plotted
     :param fig_size: (Optional) specified figure size in (width, height)
     :param save_fig: (Optional) if not None, the plot will be saved with the specified name in png
+    :param ax: (Optional) if not None, the plot is drawn on ax instead of a new figure
+    :param top_n: (Optional) if not None, only the top_n users are plotted, plus "Others"
+    :param page_size: (Optional) if not None, the maximum number of users per figure
     :return: a plot is shown and saved if specified
     """
+    df = _top_users(df, "File Name", category_names, top_n)
     data = df[category_names].to_numpy(dtype=float)
     user_labels = df["File Name"].to_numpy(dtype=str)
     data_labels = df[category_names].to_numpy(dtype=int)
-    for i in range(len(data)):
-        temp_sum = sum(data[i])
-        for j in range(6):
-            data[i][j] /= temp_sum
-
-    fig, ax = plt.subplots(figsize=fig_size)
+    sums = data.sum(axis=1, keepdims=True)
+    data = np.divide(data, sums, out=np.zeros_like(data), where=sums != 0)
+    data_cum = data.cumsum(axis=1)
     category_colors = plt.get_cmap('RdYlGn')(np.linspace(0.15, 0.85, data.shape[1]))  # Set colour
 
-    ax.invert_yaxis()
-    ax.set_xlim(0, 1)
-    ax.set_ylabel("Users")
-    data_cum = data.cumsum(axis=1)
-    for i, (colname, color) in enumerate(zip(category_names, category_colors)):
-        widths = data[:, i]
-        starts = data_cum[:, i] - widths
-        rects = ax.barh(user_labels, widths, left=starts, label=colname, color=color)
-        ax.bar_label(rects, labels=data_labels[:, i], label_type='center', color="black")
+    def draw(ax: Axes, rows: slice) -> None:
+        n_users = len(user_labels[rows])
+        ax.invert_yaxis()
+        ax.set_xlim(0, 1)
+        ax.set_ylabel("Users")
+        for i, (colname, color) in enumerate(zip(category_names, category_colors)):
+            widths = data[rows, i]
+            starts = data_cum[rows, i] - widths
+            if n_users <= LABEL_THRESHOLD:
+                rects = ax.barh(user_labels[rows], widths, left=starts, label=colname,
+                                color=color)
+                ax.bar_label(rects, labels=data_labels[rows, i], label_type='center',
+                             color="black")
+            else:
+                ax.add_collection(_bar_collection(np.arange(n_users), starts, widths, color,
+                                                  colname, thickness=1))
+        if n_users > LABEL_THRESHOLD:
+            ax.set_ylim(n_users - 0.5, -0.5)
+            ax.set_yticks([])
+            ax.set_ylabel("Users ({})".format(n_users))
 
-    ax.legend(ncol=len(category_names), bbox_to_anchor=(0, 1), loc='lower left')
-    ax.xaxis.set_major_formatter(ticker.PercentFormatter(xmax=1))
+        ax.legend(ncol=len(category_names), bbox_to_anchor=(0, 1), loc='lower left')
+        ax.xaxis.set_major_formatter(ticker.PercentFormatter(xmax=1))
 
-    plt.tight_layout()
-    if save_fig:
-        plt.savefig(save_fig + ".png")
-    plt.show()
+    _draw_figures(len(df), fig_size, save_fig, ax, page_size, draw)
 
 
-def design_space_percentage(df: pd.DataFrame, fig_size=(10.5, 8), save_fig="") -> None:
+@instrumentation.timed("plot")
+def design_space_percentage(df: Union[pd.DataFrame, Dict], fig_size=(10.5, 8), save_fig="",
+                            ax: Optional[Axes] = None, top_n: Optional[int] = None,
+                            page_size: Optional[int] = None) -> None:
     """
     Visualize the percentage of actions spent in different design spaces
-    :param df: data read from Counts.csv in pandas DataFrame
+    :param df: data read from Counts.csv in pandas DataFrame, or counts in the format returned by
+                aggregate_count (e.g., by an audit_index query)
     :param fig_size: (Optional) specified figure size in (width, height)
     :param save_fig: (Optional) if not None, the plot will be saved with the specified name in png
+    :param ax: (Optional) if not None, the plot is drawn on ax (e.g., by batch_rendering) instead of
+                a new figure, and it is neither saved nor shown
+    :param top_n: (Optional) if not None, only the top_n users with the most actions are plotted,
+                    and the others are summed as "Others"
+    :param page_size: (Optional) if not None, users are plotted on several figures of at most
+                        page_size users (saved with the page number appended to the name)
     :return: a plot is shown and saved if specified
     """
     category_names = ["Sketching", "3D Features", "Mating", "Visualizing", "Browsing",
                       "Other Organizing"]
-    _plot_percentage(df, category_names, fig_size, save_fig)
+    _plot_percentage(_as_frame(df, "File Name"), category_names, fig_size, save_fig, ax, top_n,
+                     page_size)
 
 
-def action_type_percentage(df: pd.DataFrame, fig_size=(9, 8), save_fig="") -> None:
+@instrumentation.timed("plot")
+def action_type_percentage(df: Union[pd.DataFrame, Dict], fig_size=(9, 8), save_fig="",
+                           ax: Optional[Axes] = None, top_n: Optional[int] = None,
+                           page_size: Optional[int] = None) -> None:
     """
     Visualize the percentage of actions spent in different action types
-    :param df: data read from Counts.csv in pandas DataFrame
+    :param df: data read from Counts.csv in pandas DataFrame, or counts in the format returned by
+                aggregate_count (e.g., by an audit_index query)
     :param fig_size: (Optional) specified figure size in (width, height)
     :param save_fig: (Optional) if not None, the plot will be saved with the specified name in png
+    :param ax: (Optional) if not None, the plot is drawn on ax (e.g., by batch_rendering) instead of
+                a new figure, and it is neither saved nor shown
+    :param top_n: (Optional) if not None, only the top_n users with the most actions are plotted,
+                    and the others are summed as "Others"
+    :param page_size: (Optional) if not None, users are plotted on several figures of at most
+                        page_size users (saved with the page number appended to the name)
     :return: a plot is shown and saved if specified
     """
     category_names = ["Creating", "Editing", "Deleting", "Reversing", "Viewing", "Other"]
-    _plot_percentage(df, category_names, fig_size, save_fig)
+    _plot_percentage(_as_frame(df, "File Name"), category_names, fig_size, save_fig, ax, top_n,
+                     page_size)
 
 
-def cr_ratio(df: pd.DataFrame, fig_size=(6, 6), save_fig="") -> None:
+@instrumentation.timed("plot")
+def cr_ratio(df: Union[pd.DataFrame, Dict], fig_size=(6, 6), save_fig="",
+             ax: Optional[Axes] = None) -> None:
     """
     Visualize the creation/revision ratio of every individual user
-    :param df: data read from Counts.csv in pandas DataFrame
+    :param df: data read from Counts.csv in pandas DataFrame, or counts in the format returned by
+                aggregate_count (e.g., by an audit_index query)
     :param fig_size: (Optional) specified figure size in (width, height)
     :param save_fig: (Optional) if not None, the plot will be saved with the specified name in png
+    :param ax: (Optional) if not None, the plot is drawn on ax (e.g., by batch_rendering) instead of
+                a new figure, and it is neither saved nor shown
     :return: a plot is shown and saved if specified
     """
+    df = _as_frame(df, "File Name")
     data = pd.DataFrame(df)
     data["cr"] = df["Creating"] / (df["Editing"] + df["Deleting"] + df["Reversing"])
     cr = data["cr"].to_numpy()
     user_labels = df["File Name"].to_numpy(dtype=str)
 
-    fig, ax = plt.subplots(figsize=fig_size)
+    own_figure = ax is None
+    if own_figure:
+        fig, ax = plt.subplots(figsize=fig_size)
 
     ind = np.arange(len(user_labels))
     p = ax.bar(ind, cr)
@@ -94,45 +264,134 @@ def cr_ratio(df: pd.DataFrame, fig_size=(6, 6), save_fig="") -> None:
     ax.set_xlabel("Users")
     ax.bar_label(p, fmt="%.2f", label_type='edge', padding=2)
 
-    plt.tight_layout()
-    if save_fig:
-        plt.savefig(save_fig + ".png")
-    plt.show()
+    if own_figure:
+        _show(fig, save_fig)
 
 
-def plot_contribution(df: pd.DataFrame, analyzing_category: str, fig_size=(6, 6),
-                      save_fig="") -> None:
+@instrumentation.timed("plot")
+def plot_contribution(df: Union[pd.DataFrame, Dict], analyzing_category: str, fig_size=(6, 6),
+                      save_fig="", ax: Optional[Axes] = None, top_n: Optional[int] = None,
+                      page_size: Optional[int] = None) -> None:
     """
     Visualize the percentage contribution of every individual user in the specified action category.
-    :param df: data read from Counts.csv in pandas DataFrame
+    :param df: data read from Counts.csv in pandas DataFrame, or counts in the format returned by
+                aggregate_count (e.g., by an audit_index query)
     :param analyzing_category:
     :param fig_size: (Optional) specified figure size in (width, height)
     :param save_fig: (Optional) if not None, the plot will be saved with the specified name in png
+    :param ax: (Optional) if not None, the plot is drawn on ax (e.g., by batch_rendering) instead of
+                a new figure, and it is neither saved nor shown
+    :param top_n: (Optional) if not None, only the top_n contributors are plotted, and the others
+                    are summed as "Others"
+    :param page_size: (Optional) if not None, users are plotted on several figures of at most
+                        page_size users (saved with the page number appended to the name)
     :return: a plot is shown and saved if specified
     """
-    data = pd.DataFrame(df)
+    df = _top_users(_as_frame(df, "User Name"), "User Name", [analyzing_category], top_n)
     file_total = df[analyzing_category].sum()
-    data["contri"] = df[analyzing_category] / file_total
-    contri = data["contri"].to_numpy()
+    contri = (df[analyzing_category] / file_total).to_numpy(dtype=float)
     user_labels = df["User Name"].to_numpy(dtype=str)
 
-    fig, ax = plt.subplots(figsize=fig_size)
+    def draw(ax: Axes, rows: slice) -> None:
+        ind = np.arange(len(user_labels[rows]))
+        ax.set_ylabel('Percentage ' + analyzing_category + ' Individual Contribution to File')
+        ax.set_xlabel("Users")
+        if len(ind) <= LABEL_THRESHOLD:
+            p = ax.bar(ind, contri[rows])
+            ax.set_xticks(ind)
+            ax.set_xticklabels(user_labels[rows])
+            ax.bar_label(p, fmt="%.2f", padding=3)
+            ax.tick_params(axis='x', labelrotation=90)
+        else:
+            ax.add_collection(_bar_collection(ind, np.zeros(len(ind)), contri[rows], "C0", None,
+                                              horizontal=False))
+            ax.set_xlim(-0.5, len(ind) - 0.5)
+            ax.set_ylim(0, max(contri[rows].max(), 0) * 1.05 or 1)
+            ax.set_xticks([])
+            ax.set_xlabel("Users ({})".format(len(ind)))
 
-    ind = np.arange(len(user_labels))
-    p = ax.bar(ind, contri)
-    ax.set_ylabel('Percentage ' + analyzing_category + ' Individual Contribution to File')
-    ax.set_xticks(ind)
-    ax.set_xticklabels(user_labels)
-    ax.set_xlabel("Users")
-    for rect in p:
-        height = rect.get_height()
-        ax.annotate('{:.2f}'.format(height),
-                    xy=(rect.get_x() + rect.get_width() / 2, height),
-                    xytext=(0, 3),  # 3 points vertical offset
-                    textcoords="offset points",
-                    ha='center', va='bottom')
-    plt.xticks(rotation=90)
-    plt.tight_layout()
-    if save_fig:
-        plt.savefig(save_fig + ".png")
-    plt.show()
+    _draw_figures(len(df), fig_size, save_fig, ax, page_size, draw)
+
+
+@instrumentation.timed("plot")
+def activity_over_time(series: activity_series.ActivitySeries, design_space=False,
+                       users: Optional[Sequence[str]] = None, fig_size=(10, 5),
+                       save_fig="", ax: Optional[Axes] = None) -> None:
+    """
+    Visualize the number of actions per time bucket in each category as stacked areas.
+    :param series: counts over time computed with activity_series.activity_series_frame or
+                    activity_series.activity_series_store
+    :param design_space: (Optional) if True, plot the design space categories instead of the
+                            action type categories
+    :param users: (Optional) the file/user names whose actions are summed; all users by default
+    :param fig_size: (Optional) specified figure size in (width, height)
+    :param save_fig: (Optional) if not None, the plot will be saved with the specified name in png
+    :param ax: (Optional) if not None, the plot is drawn on ax (e.g., by batch_rendering) instead of
+                a new figure, and it is neither saved nor shown
+    :return: a plot is shown and saved if specified
+    """
+    taxonomy = 0 if design_space else 1
+    counts = series.counts[taxonomy]
+    category_names = action_classification.TAXONOMIES[taxonomy].categories
+    if users is not None:
+        counts = counts[np.isin(series.users, list(users))]
+    data = counts.sum(axis=0).T  # (category, bucket)
+
+    own_figure = ax is None
+    if own_figure:
+        fig, ax = plt.subplots(figsize=fig_size)
+    category_colors = plt.get_cmap('RdYlGn')(np.linspace(0.15, 0.85, len(category_names)))
+    ax.stackplot(series.bucket_starts, data, labels=category_names, colors=category_colors,
+                 step='post')
+    ax.set_ylabel("Actions")
+    ax.set_xlabel("Time")
+    ax.legend(ncol=len(category_names), bbox_to_anchor=(0, 1), loc='lower left')
+    ax.tick_params(axis='x', labelrotation=30)
+
+    if own_figure:
+        _show(fig, save_fig)
+
+
+@instrumentation.timed("plot")
+def collaboration_heatmap(table: pd.DataFrame, value="Overlap Seconds",
+                          documents: Optional[List[str]] = None, tabs: Optional[List[str]] = None,
+                          fig_size=(8, 7), save_fig="", ax: Optional[Axes] = None) -> None:
+    """
+    Visualize the collaboration between every pair of users as a heatmap.
+    :param table: the collaboration table computed with collaboration.collaboration_frame or
+                    collaboration.collaboration_store
+    :param value: (Optional) "Overlap Seconds" (shown in hours) or "Handoffs" (from the row user
+                    to the column user)
+    :param documents: (Optional) the documents to be included; all documents by default
+    :param tabs: (Optional) the tabs to be included; all tabs by default
+    :param fig_size: (Optional) specified figure size in (width, height)
+    :param save_fig: (Optional) if not None, the plot will be saved with the specified name in png
+    :param ax: (Optional) if not None, the plot is drawn on ax (e.g., by batch_rendering) instead of
+                a new figure, and it is neither saved nor shown
+    :return: a plot is shown and saved if specified
+    """
+    users, matrix = collaboration.collaboration_matrix(table, value, documents, tabs)
+    data, label = (matrix / 3600, "Overlap Hours") if value == "Overlap Seconds" else \
+        (matrix, value)
+
+    own_figure = ax is None
+    if own_figure:
+        fig, ax = plt.subplots(figsize=fig_size)
+    image = ax.imshow(data, cmap="Greens", interpolation="nearest")
+    ax.figure.colorbar(image, ax=ax, label=label)
+    if len(users) <= LABEL_THRESHOLD:
+        ax.set_xticks(np.arange(len(users)))
+        ax.set_xticklabels(users)
+        ax.set_yticks(np.arange(len(users)))
+        ax.set_yticklabels(users)
+        ax.tick_params(axis='x', labelrotation=90)
+        ax.set_xlabel("Users")
+        ax.set_ylabel("Users")
+    else:
+        ax.set_xticks([])
+        ax.set_yticks([])
+        ax.set_xlabel("Users ({})".format(len(users)))
+        ax.set_ylabel("Users ({})".format(len(users)))
+
+    if own_figure:
+        _show(fig, save_fig)
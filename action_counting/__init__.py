@@ -1 +1,3 @@
 from action_counting import aggregate_count
+from action_counting import watch
+from action_counting import deduplication
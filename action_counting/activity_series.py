@@ -0,0 +1,157 @@
+from action_classification import action_classification
+from action_counting import aggregate_count, columnar_store
+import numpy as np
+import pandas as pd
+from collections import deque
+from typing import Deque, List, NamedTuple, Sequence, Tuple, Union
+
+# Width of the named time buckets, in seconds
+BUCKETS = {"hour": 3600, "day": 86400, "week": 7 * 86400}
+
+
+class ActivitySeries(NamedTuple):
+    """
+    Counts of actions over time: entry [u, t, c] of each count array is the number of actions of
+    category c by users[u] during the bucket starting at bucket_starts[t].
+    """
+    users: np.ndarray  # file/user names, as in aggregate_count
+    bucket_starts: np.ndarray  # datetime64[s] start of every bucket
+    counts: List[np.ndarray]  # (users, buckets, categories) counts of every taxonomy
+
+    @property
+    def design_space(self) -> np.ndarray:
+        """
+        The (users, buckets, 6) design space counts.
+        """
+        return self.counts[0]
+
+    @property
+    def action_type(self) -> np.ndarray:
+        """
+        The (users, buckets, 6) action type counts.
+        """
+        return self.counts[1]
+
+
+def _bucket_seconds(bucket: Union[str, int]) -> int:
+    return BUCKETS[bucket] if isinstance(bucket, str) else int(bucket)
+
+
+def _series(event_time: np.ndarray, key_codes: np.ndarray, keys: np.ndarray,
+            codes: Sequence[np.ndarray], width: int) -> ActivitySeries:
+    """
+    Internal function counting classified rows per (key, time bucket, category) with a single
+    vectorized bin count over integer bucket ids per taxonomy.
+    :param event_time: the event time of each row, in int64 seconds since the epoch
+    :param key_codes: the index in keys of each row
+    :param keys: the file/user names
+    :param codes: the codes of each row, one array per taxonomy (from classify_batch)
+    :param width: the width of the time buckets in seconds
+    :return: the dense activity series
+    """
+    valid = event_time != columnar_store.MISSING_TIME
+    if not valid.any():
+        return ActivitySeries(keys, np.empty(0, dtype="datetime64[s]"), [
+            np.zeros((len(keys), 0, len(definition.categories)), dtype=np.int64)
+            for definition in action_classification.TAXONOMIES])
+    origin = event_time[valid].min() // width * width
+    bucket_ids = (event_time - origin) // width
+    n_buckets = int(bucket_ids[valid].max()) + 1
+    row_cells = key_codes.astype(np.int64) * n_buckets + bucket_ids
+    counts = action_classification.tally(row_cells[valid], len(keys) * n_buckets,
+                                         [taxonomy_codes[valid] for taxonomy_codes in codes])
+    bucket_starts = (origin + width * np.arange(n_buckets)).astype("datetime64[s]")
+    return ActivitySeries(keys, bucket_starts,
+                          [count.reshape(len(keys), n_buckets, -1) for count in counts])
+
+
+def activity_series_frame(df: pd.DataFrame, file_name: str, separate_users=True,
+                          bucket: Union[str, int] = "day") -> ActivitySeries:
+    """
+    Count actions in every classification method per user and per time bucket, in a single
+    vectorized pass over an audit trail loaded in a pandas DataFrame.
+    :param df: the audit trail, with columns
+            ['Index', 'Event Time', 'Document', 'Tab', 'User', 'Description']
+    :param file_name: the file name of the csv that is being analyzed.
+    :param separate_users: (Optional) would the users be counted separately?
+    :param bucket: (Optional) the width of the time buckets: "hour", "day", "week" or a number of
+                    seconds
+    :return: the dense (user x time bucket x category) activity series
+    """
+    codes = action_classification.classify_batch(df.iloc[:, 5])
+    email_codes, emails = pd.factorize(df.iloc[:, 4].astype(str))
+    key_codes, keys = aggregate_count.user_keys(file_name, email_codes, emails, separate_users)
+    return _series(columnar_store.event_seconds(df.iloc[:, 1]), key_codes, keys, codes,
+                   _bucket_seconds(bucket))
+
+
+def activity_series_store(store: columnar_store.AuditTrailStore, file_name: str,
+                          separate_users=True, bucket: Union[str, int] = "day") -> ActivitySeries:
+    """
+    Same as activity_series_frame, for an audit trail loaded with columnar_store.load_store.
+    """
+    codes = [taxonomy_codes[store.description] for taxonomy_codes in
+             action_classification.classify_batch(store.descriptions)]
+    key_codes, keys = aggregate_count.user_keys(file_name, store.user, store.users,
+                                                separate_users)
+    return _series(store.event_time, key_codes, keys, codes, _bucket_seconds(bucket))
+
+
+def rolling_totals(counts: np.ndarray, window: int) -> np.ndarray:
+    """
+    Totals of an activity series over a sliding window of buckets, computed from cumulative sums
+    (constant time per bucket, whatever the window).
+    :param counts: a count array of an ActivitySeries, of shape (users, buckets, categories)
+    :param window: the number of buckets in the window
+    :return: an array of the same shape, whose entry [u, t, c] is the sum of the counts of buckets
+            t - window + 1 to t
+    """
+    if window < 1:
+        raise ValueError("window must be at least 1 bucket")
+    cumulative = np.cumsum(counts, axis=1)
+    totals = cumulative.copy()
+    totals[:, window:] -= cumulative[:, :-window]
+    return totals
+
+
+class RollingCounter:
+    """
+    Streaming totals of the actions of the last window seconds, in every classification method.
+    Each event is added and later expired once, so updates take constant (amortized) time.
+    Events must be added in chronological order.
+    """
+
+    def __init__(self, window: int):
+        """
+        :param window: the width of the window in seconds
+        """
+        self.window = window
+        self.count: List[List[int]] = action_classification.new_count()
+        self._events: Deque[Tuple[int, Tuple[int, ...]]] = deque()
+
+    def _apply(self, codes: Tuple[int, ...], sign: int) -> None:
+        for taxonomy, category, weight in action_classification.increments(codes):
+            self.count[taxonomy][category] += sign * weight
+
+    def add(self, event_time: int, action: str) -> List[List[int]]:
+        """
+        Add an action and expire the actions older than the window.
+        :param event_time: the event time of the action in seconds
+        :param action: the description of the action
+        :return: the totals of the window ending at event_time, in the aggregate_count format
+        """
+        self.expire(event_time)
+        codes = action_classification.classify(action.strip())
+        if codes != action_classification.UNCLASSIFIED:
+            self._events.append((event_time, codes))
+            self._apply(codes, 1)
+        return self.count
+
+    def expire(self, now: int) -> None:
+        """
+        Remove the actions that happened more than window seconds before now.
+        :param now: the current time in seconds
+        """
+        while self._events and self._events[0][0] <= now - self.window:
+            _, codes = self._events.popleft()
+            self._apply(codes, -1)
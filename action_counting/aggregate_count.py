@@ -1,5 +1,114 @@
 from action_classification import action_classification
-from typing import List, Dict
+from instrumentation import instrumentation
+from action_counting import count_cache, columnar_store
+import io
+import os
+import csv
+import time
+import numpy as np
+import pandas as pd
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Iterator, List, Dict, Optional, Tuple
+
+
+def new_count() -> List[List[int]]:
+    """
+    Create a fresh (never shared) nested list of zero counts, in the aggregate_count format.
+    :return: [[0, 0, 0, 0, 0, 0], [0, 0, 0, 0, 0, 0]], sized from the taxonomies
+    """
+    return action_classification.new_count()
+
+
+def _add_action(count: List[List[int]], codes: Tuple[int, ...]) -> None:
+    """
+    Internal function adding one classified action to a nested list of counts.
+    :param count: the counts of every taxonomy to be updated in place
+    :param codes: the codes of the action in every taxonomy (see action_classification.classify)
+    """
+    for taxonomy, category, weight in action_classification.increments(codes):
+        count[taxonomy][category] += weight
+
+
+# Number of csv rows read and classified at a time by the csv.reader counting functions (small
+# batches stay in the CPU caches, larger ones are slower than counting row by row)
+SCAN_BATCH_ROWS = 256
+
+
+def _scan(reader: iter, file_name: str, separate_users=False, by_document=False,
+          by_tab=False) -> Dict[str, Dict]:
+    """
+    Internal aggregation engine: reads every row of the audit trail once, classifies it in both
+    classification methods with a single call and updates every requested table. Rows are handled
+    in batches of SCAN_BATCH_ROWS rows, going through each step (parsing, classification, user
+    keys and tally) in turn, so that each step is timed as its own stage when the instrumentation
+    is enabled.
+    :param reader: the csv reader of the audit trail file (positioned after the header).
+    :param file_name: the file name of the csv that is being analyzed.
+    :param separate_users: would the users in the csv file be counted separately?
+    :param by_document: also count actions per (file/user, document)?
+    :param by_tab: also count actions per (file/user, document, tab)?
+    :return: a dictionary with the "total" table and, if requested, the "document" and "tab" tables
+    """
+    totals = {}
+    documents = {}
+    tabs = {}
+    users = {}  # raw User column value -> interned user name
+    if not separate_users:
+        totals[file_name] = new_count()
+    histogram = instrumentation.unclassified_histogram()
+    classify = action_classification.classify
+    unclassified = action_classification.UNCLASSIFIED
+    while True:
+        """
+        Each row has format: 
+        ['Index', 'Event Time', 'Document', 'Tab', 'User', 'Description']
+        Example: 
+        ['1', '2021-08-21 19:12:19', 'Doc', 'N/A', 'x@x.com', 'Close document']
+        """
+        with instrumentation.stage("parse") as timer:
+            rows = list(islice(reader, SCAN_BATCH_ROWS))
+            if timer is not None:
+                timer.rows = len(rows)
+        if not rows:
+            break
+        with instrumentation.stage("classify", rows=len(rows)):
+            actions = [row[5].strip() for row in rows]
+            codes = [classify(action) for action in actions]
+        if separate_users:
+            with instrumentation.stage("user keys", rows=len(rows)):
+                for row in rows:
+                    if row[4] not in users:
+                        users[row[4]] = file_name + '/' + row[4].strip().split("@")[0]
+                row_users = [users[row[4]] for row in rows]
+        else:
+            row_users = [file_name] * len(rows)
+        with instrumentation.stage("tally", rows=len(rows)):
+            for row, action, action_codes, user in zip(rows, actions, codes, row_users):
+                if action_codes == unclassified:
+                    if histogram is not None:
+                        histogram[action] += 1
+                    continue
+                count = totals.get(user)
+                if count is None:
+                    count = totals[user] = new_count()
+                _add_action(count, action_codes)
+                if by_document:
+                    key = (user, row[2].strip())
+                    if key not in documents:
+                        documents[key] = new_count()
+                    _add_action(documents[key], action_codes)
+                if by_tab:
+                    key = (user, row[2].strip(), row[3].strip())
+                    if key not in tabs:
+                        tabs[key] = new_count()
+                    _add_action(tabs[key], action_codes)
+    tables = {"total": totals}
+    if by_document:
+        tables["document"] = documents
+    if by_tab:
+        tables["tab"] = tabs
+    return tables
 
 
 def count_design_space(reader: iter) -> List[int]:
@@ -10,24 +119,8 @@ def count_design_space(reader: iter) -> List[int]:
             Output list items correspond to the following design space count:
             [sketching, 3D features, mating, visualizing, browsing, other organizing]
     """
-    count = [0, 0, 0, 0, 0, 0]
     next(reader)
-    for row in reader:
-        """
-        Each row has format: 
-        ['Index', 'Event Time', 'Document', 'Tab', 'User', 'Description']
-        Example: 
-        ['1', '2021-08-21 19:12:19', 'Doc', 'N/A', 'x@x.com', 'Close document']
-        """
-        # Classify actions in design space
-        design_space = action_classification.classify_design_space(row[5].strip())
-        if design_space != -1:
-            if design_space == -10:  # the special "Add or modify a sketch" action
-                count[0] += 1
-                count[1] -= 1
-            else:
-                count[design_space] += 1
-    return count
+    return _scan(reader, "")["total"][""][0]
 
 
 def count_action_type(reader: iter) -> List[int]:
@@ -38,20 +131,8 @@ def count_action_type(reader: iter) -> List[int]:
             Output list items correspond to the following action type count:
             [creating, editing, deleting, revising, viewing, others]
     """
-    count = [0, 0, 0, 0, 0, 0]
     next(reader)
-    for row in reader:
-        """
-        Each row has format: 
-        ['Index', 'Event Time', 'Document', 'Tab', 'User', 'Description']
-        Example: 
-        ['1', '2021-08-21 19:12:19', 'Doc', 'N/A', 'x@x.com', 'Close document']
-        """
-        # Classify actions in action type
-        action_type = action_classification.classify_action_type(row[5].strip())
-        if action_type >= 0:
-            count[action_type] += 1
-    return count
+    return _scan(reader, "")["total"][""][1]
 
 
 def aggregate_count(reader: iter, file_name: str, separate_users=False) -> Dict:
@@ -71,52 +152,391 @@ def aggregate_count(reader: iter, file_name: str, separate_users=False) -> Dict:
             [[sketching, 3D features, mating, visualizing, browsing, other organizing],
              [creating, editing, deleting, revising, viewing, other]]
     """
-    empty_count = [[0, 0, 0, 0, 0, 0],
-                   [0, 0, 0, 0, 0, 0]]
     next(reader)
+    return _scan(reader, file_name, separate_users=separate_users)["total"]
+
+
+def aggregate_breakdown(reader: iter, file_name: str, separate_users=False, by_document=True,
+                        by_tab=True) -> Dict[str, Dict]:
+    """
+    Aggregate count of actions in both classification methods, together with per-document and
+    per-tab breakdowns computed in the same pass over the audit trail.
+    :param reader: the csv reader of the audit trail file.
+    :param file_name: the file name of the csv that is being analyzed.
+    :param separate_users: if more than one user is found in one csv file, would their counts be
+                            counted separately?
+    :param by_document: (Optional) if True, counts are also broken down by document
+    :param by_tab: (Optional) if True, counts are also broken down by document and tab
+    :return: a dictionary of tables, each mapping a key to counts in the aggregate_count format:
+            "total": {file/user: counts} (same as aggregate_count)
+            "document": {(file/user, document): counts} (if by_document)
+            "tab": {(file/user, document, tab): counts} (if by_tab)
+    """
+    next(reader)
+    return _scan(reader, file_name, separate_users=separate_users, by_document=by_document,
+                 by_tab=by_tab)
+
+
+@instrumentation.timed("merge")
+def merge_counts(counts: Dict, partial: Dict) -> Dict:
+    """
+    Merge partial counts (e.g., returned by aggregate_count for another file) into counts. Counts
+    of keys found in both are summed, so merging is associative and the order of merging does not
+    affect the result.
+    :param counts: the counts to be updated in place, in the format returned by aggregate_count
+    :param partial: the counts to be added, in the format returned by aggregate_count
+    :return: counts, updated in place
+    """
+    for key, count in partial.items():
+        total = counts.get(key)
+        if total is None:
+            counts[key] = [list(count_list) for count_list in count]
+        else:
+            for total_list, count_list in zip(total, count):
+                for i, value in enumerate(count_list):
+                    total_list[i] += value
+    return counts
+
+
+def count_file(file_path: str, file_name: str, separate_users: bool, start=0, end=-1) -> Dict:
+    """
+    Count one audit trail file, or a byte range of it (aggregate_directory runs it in worker
+    processes).
+    :param file_path: the path of the csv file
+    :param file_name: the file name used to label the counts
+    :param separate_users: would the users in the csv file be counted separately?
+    :param start: (Optional) the first byte to count, on a line boundary
+    :param end: (Optional) the byte following the last byte to count; -1 counts the whole file
+    :return: the counts of the file in the format returned by aggregate_count
+    """
+    if end < 0:
+        with open(file_path, 'r') as audit_trail_csv:
+            return aggregate_count(csv.reader(audit_trail_csv), file_name,
+                                   separate_users=separate_users)
+    counts = {file_name: new_count()} if not separate_users else {}
+    return merge_counts(counts, _count_range(file_path, file_name, start, end, separate_users,
+                                             CHUNK_BYTES)[0])
+
+
+def count_tail(file_path: str, file_name: str, separate_users: bool, end: int) -> Dict:
+    """
+    Count the rows after the last complete line of a file (as returned by CountCache.lookup or
+    count_cache.complete_lines_end), i.e., a last row without a final line break. It is counted if
+    it has all its fields, but never cached, since it may still be being written.
+    :param file_path: the path of the csv file
+    :param file_name: the file name used to label the counts
+    :param separate_users: would the users in the csv file be counted separately?
+    :param end: the end of the last complete line of the file
+    :return: the counts of the rows in the format returned by aggregate_count
+    """
+    with open(file_path, 'rb') as audit_trail_csv:
+        audit_trail_csv.seek(end)
+        tail = audit_trail_csv.read().decode(errors="replace")
+    rows = list(csv.reader(io.StringIO(tail)))
+    if end == 0:
+        rows = rows[1:]  # the header
+    return _scan((row for row in rows if len(row) >= 6), file_name,
+                 separate_users=separate_users)["total"]
+
+
+def list_audit_trails(directory: str) -> List[Tuple[str, str]]:
+    """
+    List the csv audit trails found in a directory and its subdirectories.
+    :param directory: the directory to be searched
+    :return: a sorted list of (file path, file name without the ".csv" extension)
+    """
+    audit_trails = []
+    for root, _, files in os.walk(directory):
+        for File in files:
+            if File.endswith(".csv"):
+                audit_trails.append((os.path.join(root, File), File[:-4]))
+    return sorted(audit_trails)
+
+
+def aggregate_directory(directory: str, jobs: Optional[int] = None, separate_users=False,
+                        cache: Optional[count_cache.CountCache] = None) -> Dict:
+    """
+    Aggregate count of actions of every csv audit trail in a directory (and its subdirectories),
+    fanning the files out over a pool of worker processes.
+    Note: on platforms starting worker processes by spawning (Windows, macOS), the calling script
+    must be protected by if __name__ == "__main__":.
+    :param directory: the directory of the audit trail files
+    :param jobs: (Optional) the number of worker processes; defaults to the number of CPUs, and 1
+                    counts the files serially in the current process
+    :param separate_users: if more than one user is found in one csv file, would their counts be
+                            counted separately?
+    :param cache: (Optional) if given, the counts of unchanged files are read from the cache, only
+                    the appended rows of grown files are counted, and new counts are stored
+    :return: a dictionary of counts in the same format as aggregate_count, merged over all files
+            and ordered by file/user name
+    """
+    counts = {}
+    tasks = []  # (file path, file name, cached counts, first byte to count, end of the count)
+    for file_path, file_name in list_audit_trails(directory):
+        if cache is None:
+            tasks.append((file_path, file_name, None, 0, -1))
+            continue
+        stored, start, end = cache.lookup(file_path, file_name, separate_users)
+        if stored is not None and start == end:
+            merge_counts(counts, stored)
+            merge_counts(counts, count_tail(file_path, file_name, separate_users, end))
+        else:
+            tasks.append((file_path, file_name, stored, start, end))
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(tasks))
+    if jobs <= 1:
+        partials = (count_file(file_path, file_name, separate_users, start, end)
+                    for file_path, file_name, _, start, end in tasks)
+        return _merge_tasks(counts, tasks, partials, separate_users, cache)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        file_paths, file_names, _, starts, ends = zip(*tasks)
+        chunk_size = max(1, len(tasks) // (jobs * 4))
+        partials = instrumentation.map_workers(executor, count_file, file_paths, file_names,
+                                               [separate_users] * len(tasks), starts, ends,
+                                               chunksize=chunk_size)
+        return _merge_tasks(counts, tasks, partials, separate_users, cache)
+
+
+def _merge_tasks(counts: Dict, tasks: List[Tuple], partials: Iterator[Dict], separate_users: bool,
+                 cache: Optional[count_cache.CountCache]) -> Dict:
+    """
+    Internal function merging the counts of the files counted by aggregate_directory, completing
+    them with their cached counts and storing them in the cache if one is used.
+    :return: the merged counts, ordered by file/user name
+    """
+    for (file_path, file_name, stored, _, end), partial in zip(tasks, partials):
+        if stored is not None:
+            merge_counts(partial, stored)
+        if cache is not None:
+            cache.store(file_path, file_name, separate_users, partial, end)
+            merge_counts(counts, count_tail(file_path, file_name, separate_users, end))
+        merge_counts(counts, partial)
+    return {key: counts[key] for key in sorted(counts)}
+
+
+def aggregate_count_frame(df: pd.DataFrame, file_name: str, separate_users=False) -> Dict:
+    """
+    Vectorized equivalent of aggregate_count for an audit trail already loaded in a pandas
+    DataFrame (e.g., with pd.read_csv). Descriptions are classified once per distinct value with
+    classify_batch instead of once per row.
+    :param df: the audit trail, with columns
+            ['Index', 'Event Time', 'Document', 'Tab', 'User', 'Description']
+    :param file_name: the file name of the csv that is being analyzed.
+    :param separate_users: if more than one user is found in one csv file, would their counts be
+                            counted separately?
+    :return: a dictionary of counts in the same format as aggregate_count
+    """
+    codes = action_classification.classify_batch(df.iloc[:, 5])
     if not separate_users:
-        count = empty_count
-    else:
-        count = {}
-    for row in reader:
-        """
-        Each row has format: 
-        ['Index', 'Event Time', 'Document', 'Tab', 'User', 'Description']
-        Example: 
-        ['1', '2021-08-21 19:12:19', 'Doc', 'N/A', 'x@x.com', 'Close document']
-        """
-        # Classify actions in design space
-        design_space = action_classification.classify_design_space(row[5].strip())
-        if design_space != -1:
-            if design_space == -10:  # the special "Add or modify a sketch" action
-                if not separate_users:
-                    count[0][0] += 1
-                    count[0][1] -= 1
-                else:
-                    user = file_name + '/' + row[4].strip().split("@")[0]
-                    if user not in count:
-                        count[user] = empty_count
-                    count[user][0][0] += 1
-                    count[user][0][1] -= 1
-            else:
-                if not separate_users:
-                    count[0][design_space] += 1
-                else:
-                    user = file_name + '/' + row[4].strip().split("@")[0]
-                    if user not in count:
-                        count[user] = empty_count
-                    count[user][0][design_space] += 1
-        # Classify actions in action type
-        action_type = action_classification.classify_action_type(row[5].strip())
-        if action_type >= 0:
-            if not separate_users:
-                count[1][action_type] += 1
-            else:
-                user = file_name + '/' + row[4].strip().split("@")[0]
-                if user not in count:
-                    count[user] = empty_count
-                count[user][1][action_type] += 1
-    if separate_users:
-        return count
+        return _count_encoded(file_name, codes)
+    email_codes, emails = pd.factorize(df.iloc[:, 4].astype(str))
+    return _count_encoded(file_name, codes, email_codes, emails)
+
+
+def user_keys(file_name: str, email_codes: np.ndarray, emails: np.ndarray,
+              separate_users: bool) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Map dictionary-encoded User values to the file/user names used in the counts: the file name,
+    or the file name and the name of the email of the user (emails differing only in whitespace
+    share a user).
+    :param file_name: the file name of the csv that is being analyzed.
+    :param email_codes: the index in emails of the User of each row
+    :param emails: the distinct values of the User column
+    :param separate_users: are the users counted separately?
+    :return: the index of the file/user name of each row, and the file/user names
+    """
+    if not separate_users:
+        return np.zeros(len(email_codes), dtype=np.int64), np.array([file_name], dtype=object)
+    user_of_email, users = pd.factorize(
+        np.array([file_name + '/' + email.strip().split("@")[0] for email in emails], dtype=object))
+    return user_of_email[email_codes], np.asarray(users, dtype=object)
+
+
+def _count_encoded(file_name: str, codes: Tuple[np.ndarray, ...],
+                   email_codes: Optional[np.ndarray] = None,
+                   emails: Optional[np.ndarray] = None) -> Dict:
+    """
+    Internal function counting classified rows, per user if the dictionary-encoded User column is
+    given (separate_users mode) or per file otherwise.
+    :param file_name: the file name of the csv that is being analyzed.
+    :param codes: the codes of each row, one array per taxonomy (from classify_batch)
+    :param email_codes: (Optional) the index in emails of the User of each row
+    :param emails: (Optional) the distinct values of the User column
+    :return: a dictionary of counts in the same format as aggregate_count
+    """
+    n_rows = len(codes[0])
+    if email_codes is None:
+        with instrumentation.stage("tally", rows=n_rows):
+            totals = action_classification.tally(np.zeros(n_rows, dtype=np.int64), 1, codes)
+            return {file_name: [total[0].tolist() for total in totals]}
+    with instrumentation.stage("user keys", rows=len(email_codes)):
+        # The user name is built once per distinct email
+        user_codes, users = user_keys(file_name, email_codes, emails, True)
+    with instrumentation.stage("tally", rows=n_rows):
+        totals = action_classification.tally(user_codes, len(users), codes)
+        # Only users with at least one classified action are reported, as in aggregate_count
+        active = np.bincount(user_codes[action_classification.classified(codes)],
+                             minlength=len(users))
+        return {user: [total[i].tolist() for total in totals]
+                for i, user in enumerate(users) if active[i]}
+
+
+def aggregate_count_store(store: columnar_store.AuditTrailStore, file_name: str,
+                          separate_users=False) -> Dict:
+    """
+    Vectorized equivalent of aggregate_count for an audit trail converted to the columnar format
+    (see columnar_store.convert_csv). Only the dictionaries of distinct descriptions and users are
+    read as strings; the rows are counted from their integer codes.
+    :param store: the audit trail loaded with columnar_store.load_store
+    :param file_name: the file name of the audit trail that is being analyzed.
+    :param separate_users: if more than one user is found in the audit trail, would their counts be
+                            counted separately?
+    :return: a dictionary of counts in the same format as aggregate_count
+    """
+    codes = tuple(taxonomy_codes[store.description] for taxonomy_codes in
+                  action_classification.classify_batch(store.descriptions))
+    if not separate_users:
+        return _count_encoded(file_name, codes)
+    return _count_encoded(file_name, codes, store.user, store.users)
+
+
+# Default number of bytes of csv text parsed and classified at a time in streaming mode
+CHUNK_BYTES = 64 * 1024 * 1024
+
+
+def split_byte_ranges(file_path: str, parts: int, start=0, end=-1) -> List[Tuple[int, int]]:
+    """
+    Split an audit trail file into byte ranges of similar size that start and end on line
+    boundaries, so that each range can be counted independently (e.g., by a different process).
+    Note: rows are assumed not to contain quoted line breaks, which Onshape exports do not produce.
+    :param file_path: the path of the csv file
+    :param parts: the number of ranges to split the file into
+    :param start: (Optional) the first byte of the part of the file to split, on a line boundary
+    :param end: (Optional) the end of the part of the file to split; -1 is the end of the file
+    :return: a list of at most parts (start, end) byte offsets covering the part of the file
+    """
+    if end < 0:
+        end = os.path.getsize(file_path)
+    bounds = [start]
+    with open(file_path, 'rb') as audit_trail_csv:
+        for i in range(1, parts):
+            audit_trail_csv.seek(max(start + (end - start) * i // parts, bounds[-1]))
+            audit_trail_csv.readline()  # move to the start of the next line
+            bounds.append(min(audit_trail_csv.tell(), end))
+    bounds.append(end)
+    return [(first, last) for first, last in zip(bounds, bounds[1:]) if first < last]
+
+
+def read_chunks(file_path: str, start: int, end: int,
+                chunk_bytes: int) -> Iterator[pd.DataFrame]:
+    """
+    Generator parsing the rows within a byte range of an audit trail file, one chunk of about
+    chunk_bytes bytes at a time; the header is skipped if the range starts the file.
+    :param file_path: the path of the csv file
+    :param start: the first byte of the range (on a line boundary)
+    :param end: the byte following the range (on a line boundary or at the end of the file)
+    :param chunk_bytes: the number of bytes to parse at a time
+    :return: DataFrames of the rows in the range, without column names
+    """
+    with open(file_path, 'rb') as audit_trail_csv:
+        audit_trail_csv.seek(start)
+        if start == 0:
+            audit_trail_csv.readline()
+        position = audit_trail_csv.tell()
+        while position < end:
+            block = audit_trail_csv.read(min(chunk_bytes, end - position))
+            if not block:
+                break
+            if not block.endswith(b"\n"):
+                block += audit_trail_csv.readline()  # complete the last row of the chunk
+            position = audit_trail_csv.tell()
+            if block.strip():
+                with instrumentation.stage("parse") as timer:
+                    chunk = pd.read_csv(io.BytesIO(block), header=None, dtype=str,
+                                        keep_default_na=False)
+                    if timer is not None:
+                        timer.rows = len(chunk)
+                yield chunk
+
+
+def _count_range(file_path: str, file_name: str, start: int, end: int, separate_users: bool,
+                 chunk_bytes: int) -> Tuple[Dict, int]:
+    """
+    Internal worker function counting the rows within a byte range of an audit trail file.
+    :return: the counts of the range in the format returned by aggregate_count, and the number of
+            rows read
+    """
+    counts = {}
+    rows = 0
+    for chunk in read_chunks(file_path, start, end, chunk_bytes):
+        merge_counts(counts, aggregate_count_frame(chunk, file_name, separate_users))
+        rows += len(chunk)
+    return counts, rows
+
+
+def print_progress(rows: int, rows_per_second: float) -> None:
+    """
+    Default progress callback of aggregate_count_stream: print the progress of the count.
+    :param rows: the number of rows processed so far
+    :param rows_per_second: the average throughput so far
+    """
+    print("{:,} rows processed ({:,.0f} rows/s)".format(rows, rows_per_second))
+
+
+def aggregate_count_stream(file_path: str, file_name: str, separate_users=False,
+                           chunk_bytes=CHUNK_BYTES, jobs=1,
+                           progress: Optional[Callable[[int, float], None]] = None,
+                           cache: Optional[count_cache.CountCache] = None) -> Dict:
+    """
+    Streaming equivalent of aggregate_count for very large audit trail files. The file is parsed
+    in chunks of about chunk_bytes bytes, each chunk being classified in a batch, so memory use is
+    bounded by the chunk size rather than the file size. With jobs > 1, the file is split into
+    byte ranges counted in parallel by worker processes.
+    :param file_path: the path of the csv file
+    :param file_name: the file name of the csv that is being analyzed.
+    :param separate_users: if more than one user is found in one csv file, would their counts be
+                            counted separately?
+    :param chunk_bytes: (Optional) the number of bytes to parse and classify at a time
+    :param jobs: (Optional) the number of worker processes counting the file in parallel
+    :param progress: (Optional) a function called with the number of rows processed so far and the
+                        throughput in rows per second, after every chunk (or every byte range if
+                        jobs > 1); use print_progress to print the progress
+    :param cache: (Optional) if given, the counts are read from the cache if the file is unchanged,
+                    only the appended rows are counted if the file grew, and new counts are stored
+    :return: a dictionary of counts in the same format as aggregate_count
+    """
+    counts = {file_name: new_count()} if not separate_users else {}
+    start, end = 0, os.path.getsize(file_path)
+    if cache is not None:
+        stored, start, end = cache.lookup(file_path, file_name, separate_users)
+        if stored is not None:
+            merge_counts(counts, stored)
+        if start == end:
+            return merge_counts(counts, count_tail(file_path, file_name, separate_users, end))
+    rows = 0
+    start_time = time.perf_counter()
+
+    def report(new_rows: int) -> None:
+        nonlocal rows
+        rows += new_rows
+        if progress is not None:
+            progress(rows, rows / max(time.perf_counter() - start_time, 1e-9))
+
+    if jobs <= 1:
+        for chunk in read_chunks(file_path, start, end, chunk_bytes):
+            merge_counts(counts, aggregate_count_frame(chunk, file_name, separate_users))
+            report(len(chunk))
     else:
-        return {file_name: count}
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [instrumentation.submit_worker(executor, _count_range, file_path, file_name,
+                                                     first, last, separate_users, chunk_bytes)
+                       for first, last in split_byte_ranges(file_path, jobs, start, end)]
+            for future in as_completed(futures):
+                partial, range_rows = instrumentation.worker_result(future)
+                merge_counts(counts, partial)
+                report(range_rows)
+    if cache is not None:
+        cache.store(file_path, file_name, separate_users, counts, end)
+        merge_counts(counts, count_tail(file_path, file_name, separate_users, end))
+    return counts
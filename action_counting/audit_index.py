@@ -0,0 +1,281 @@
+from action_classification import action_classification
+from action_counting import aggregate_count, columnar_store
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+# Fields rows can be filtered and grouped by, in the order of the composite group keys
+FIELDS = ("user", "document", "tab")
+
+# Number of low bits of a composite key holding the event time (offset from the earliest one)
+_TIME_BITS = 34
+
+Names = Optional[Union[str, Sequence[str]]]
+Time = Optional[Union[int, str, datetime, np.datetime64]]
+
+
+class _Rows(NamedTuple):
+    """
+    Internal encoded rows of one audit trail, before they are merged into an index.
+    """
+    event_time: np.ndarray  # int64 seconds since the epoch
+    user: np.ndarray  # codes into users
+    document: np.ndarray  # codes into documents
+    tab: np.ndarray  # codes into tabs
+    codes: Tuple[np.ndarray, ...]  # the classification codes, one array per taxonomy
+    users: np.ndarray  # file/user names, as in aggregate_count
+    documents: np.ndarray
+    tabs: np.ndarray
+
+
+class _GroupIndex(NamedTuple):
+    """
+    Internal index of the rows grouped by some fields: rows are sorted by (group, event time), and
+    prefix sums of their counts give the counts of any time range of a group with two binary
+    searches.
+    """
+    groups: np.ndarray  # the codes of the fields of every group, (groups, fields)
+    keys: np.ndarray  # the sorted composite (group rank, time offset) key of every row
+    prefix: np.ndarray  # (rows + 1, categories) cumulative counts, taxonomy by taxonomy
+
+
+def _seconds(value: Time) -> int:
+    """
+    Internal function converting a time bound to seconds since the epoch (as in the columnar
+    format); integers are taken as seconds already.
+    """
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    return int(pd.Timestamp(value).value // 10 ** 9)
+
+
+def _encode(values: Union[pd.Series, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object).astype(str).str.strip())
+    return codes, np.asarray(uniques, dtype=object)
+
+
+def _classified_rows(event_time: np.ndarray, user_codes: np.ndarray, users: np.ndarray,
+                     document: np.ndarray, documents: np.ndarray, tab: np.ndarray,
+                     tabs: np.ndarray, codes: Tuple[np.ndarray, ...]) -> _Rows:
+    """
+    Internal function keeping the rows classified in at least one classification method.
+    """
+    keep = action_classification.classified(codes)
+    return _Rows(np.asarray(event_time, dtype=np.int64)[keep], user_codes[keep], document[keep],
+                 tab[keep], tuple(taxonomy_codes[keep] for taxonomy_codes in codes), users,
+                 documents, tabs)
+
+
+def _frame_rows(df: pd.DataFrame, file_name: str, separate_users: bool) -> _Rows:
+    codes = action_classification.classify_batch(df.iloc[:, 5])
+    email_codes, emails = pd.factorize(df.iloc[:, 4].astype(str))
+    user_codes, users = aggregate_count.user_keys(file_name, email_codes, emails, separate_users)
+    return _classified_rows(columnar_store.event_seconds(df.iloc[:, 1]), user_codes, users,
+                            *_encode(df.iloc[:, 2]), *_encode(df.iloc[:, 3]), codes)
+
+
+def _store_rows(store: columnar_store.AuditTrailStore, file_name: str,
+                separate_users: bool) -> _Rows:
+    codes = action_classification.classify_batch(store.descriptions)
+    user_codes, users = aggregate_count.user_keys(file_name, store.user, store.users,
+                                                  separate_users)
+    # Values differing only in whitespace are merged, as in aggregate_count
+    document_codes, documents = _encode(store.documents)
+    tab_codes, tabs = _encode(store.tabs)
+    return _classified_rows(store.event_time, user_codes, users, document_codes[store.document],
+                            documents, tab_codes[store.tab], tabs,
+                            tuple(taxonomy_codes[store.description] for taxonomy_codes in codes))
+
+
+def _merge_dictionaries(codes: List[np.ndarray],
+                        dictionaries: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Internal function merging the dictionaries of a column of several audit trails.
+    :param codes: the codes of the rows of every audit trail, into its own dictionary
+    :param dictionaries: the distinct values of the column in every audit trail
+    :return: the merged dictionary, and the codes of all rows into it
+    """
+    merged, values = pd.factorize(np.concatenate(dictionaries))
+    offsets = np.cumsum([0] + [len(dictionary) for dictionary in dictionaries[:-1]])
+    return np.asarray(values, dtype=object), np.concatenate(
+        [merged[offset + np.asarray(part, dtype=np.int64)]
+         for offset, part in zip(offsets, codes)]).astype(np.int64)
+
+
+def _count_lists(total: np.ndarray) -> List[List[int]]:
+    """
+    Internal function splitting the counts of the categories of every taxonomy, side by side, into
+    the aggregate_count format.
+    """
+    bounds = np.cumsum([len(definition.categories)
+                        for definition in action_classification.TAXONOMIES])[:-1]
+    return [part.tolist() for part in np.split(total, bounds)]
+
+
+class AuditTrailIndex:
+    """
+    In-memory index of one or more audit trails answering filtered counts (by file/user, document,
+    tab and time range) without scanning the rows: for every combination of fields queried, the
+    rows are sorted once by (group, event time) with prefix sums of their counts, so a query costs
+    two binary searches per matching group. Only the rows classified in at least one method are
+    kept. Build it with index_frame, index_store or index_directory.
+    """
+
+    def __init__(self, parts: Sequence[_Rows]):
+        """
+        :param parts: the encoded rows of every audit trail (see index_frame)
+        """
+        parts = list(parts)
+        if not parts:  # e.g., a directory without audit trails
+            no_rows, no_values = np.empty(0, dtype=np.int64), np.empty(0, dtype=object)
+            parts = [_Rows(*[no_rows] * 4, (no_rows,) * len(action_classification.TAXONOMIES),
+                           *[no_values] * 3)]
+        self._codes = {}
+        self.users, self._codes["user"] = _merge_dictionaries(
+            [part.user for part in parts], [part.users for part in parts])
+        self.documents, self._codes["document"] = _merge_dictionaries(
+            [part.document for part in parts], [part.documents for part in parts])
+        self.tabs, self._codes["tab"] = _merge_dictionaries(
+            [part.tab for part in parts], [part.tabs for part in parts])
+        event_time = np.concatenate([part.event_time for part in parts])
+        valid = event_time != columnar_store.MISSING_TIME
+        self._origin = int(event_time[valid].min()) if valid.any() else 0
+        # Time offsets from 1 up; rows without a valid time come first, at 0
+        self._time_offset = np.where(valid, event_time - self._origin + 1, 0)
+        if len(event_time) and self._time_offset.max() >= 2 ** _TIME_BITS:
+            raise ValueError("the audit trails span too long a time to be indexed")
+        # Per-row counts: the weights of the code of the row in every taxonomy, side by side
+        # (one-hot for the codes of a single category)
+        self._counts = np.concatenate(
+            [definition.weights()[definition.weight_rows(
+                np.concatenate([part.codes[i] for part in parts]))].astype(np.int8)
+             for i, definition in enumerate(action_classification.TAXONOMIES)], axis=1)
+        self._indexes: Dict[Tuple[str, ...], _GroupIndex] = {}
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def _index(self, fields: Tuple[str, ...]) -> _GroupIndex:
+        """
+        Internal function building (once) the index of the rows grouped by fields.
+        """
+        index = self._indexes.get(fields)
+        if index is not None:
+            return index
+        shape = tuple(len(getattr(self, field + "s")) for field in fields)
+        group_ids, rank = np.unique(np.ravel_multi_index(
+            [self._codes[field] for field in fields], shape) if fields else
+            np.zeros(len(self), dtype=np.int64), return_inverse=True)
+        groups = np.stack(np.unravel_index(group_ids, shape), axis=1) if fields else \
+            np.zeros((len(group_ids), 0), dtype=np.int64)
+        rank = rank.reshape(-1)
+        keys = (rank.astype(np.int64) << _TIME_BITS) | self._time_offset
+        order = np.argsort(keys, kind="stable")
+        dtype = np.int32 if len(self) < 2 ** 31 else np.int64
+        prefix = np.zeros((len(self) + 1, self._counts.shape[1]), dtype=dtype)
+        np.cumsum(self._counts[order], axis=0, dtype=dtype, out=prefix[1:])
+        index = self._indexes[fields] = _GroupIndex(groups, keys[order], prefix)
+        return index
+
+    def _query(self, by: Tuple[str, ...], start: Time, end: Time,
+               filters: Dict[str, Names]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Internal function counting the rows of every group of the fields filtered or grouped by.
+        :return: the codes of the by fields of every group with rows, and the counts of the groups
+        """
+        filters = {field: names for field, names in filters.items() if names is not None}
+        fields = tuple(field for field in FIELDS if field in filters or field in by)
+        index = self._index(fields)
+        selected = np.ones(len(index.groups), dtype=bool)
+        for i, field in enumerate(fields):
+            if field in filters:
+                names = [filters[field]] if isinstance(filters[field], str) else filters[field]
+                values = getattr(self, field + "s")
+                codes = np.flatnonzero(np.isin(values, np.asarray(list(names), dtype=object)))
+                selected &= np.isin(index.groups[:, i], codes)
+        ranks = np.flatnonzero(selected).astype(np.int64) << _TIME_BITS
+        # Rows without a valid event time only match queries without time bounds
+        first = 0 if start is None and end is None else \
+            1 if start is None else max(_seconds(start) - self._origin + 1, 1)
+        last = 2 ** _TIME_BITS if end is None else max(_seconds(end) - self._origin + 1, 1)
+        lower = np.searchsorted(index.keys, ranks + min(first, 2 ** _TIME_BITS))
+        upper = np.searchsorted(index.keys, ranks + min(last, 2 ** _TIME_BITS))
+        counts = index.prefix[upper].astype(np.int64) - index.prefix[lower]
+        nonempty = upper > lower
+        groups = index.groups[selected][nonempty]
+        return groups[:, [fields.index(field) for field in by]], counts[nonempty]
+
+    def count(self, users: Names = None, documents: Names = None, tabs: Names = None,
+              start: Time = None, end: Time = None) -> List[List[int]]:
+        """
+        Count the actions matching all the given filters.
+        :param users: (Optional) the file/user name(s) (as in aggregate_count) of the actions
+        :param documents: (Optional) the document(s) of the actions
+        :param tabs: (Optional) the tab(s) of the actions
+        :param start: (Optional) the earliest event time of the actions (inclusive), as seconds
+                        since the epoch, a datetime or a string such as "2021-03-15"
+        :param end: (Optional) the latest event time of the actions (exclusive)
+        :return: the count of the actions in the aggregate_count format:
+                [[6 design space counts], [6 action type counts]]
+        """
+        _, counts = self._query((), start, end, {"user": users, "document": documents,
+                                                  "tab": tabs})
+        total = counts.sum(axis=0) if len(counts) else np.zeros(counts.shape[1], dtype=np.int64)
+        return _count_lists(total)
+
+    def count_by(self, by="user", users: Names = None, documents: Names = None,
+                 tabs: Names = None, start: Time = None, end: Time = None) -> Dict:
+        """
+        Count the actions matching all the given filters (see count) per file/user, document or
+        tab. The result can be plotted directly (see plotting).
+        :param by: (Optional) "user", "document" or "tab"
+        :return: a dictionary of counts in the same format as aggregate_count, keyed by the names
+                of the by field with at least one matching action and ordered by name
+        """
+        if by not in FIELDS:
+            raise ValueError("by must be one of {}".format(FIELDS))
+        groups, counts = self._query((by,), start, end, {"user": users, "document": documents,
+                                                         "tab": tabs})
+        values = getattr(self, by + "s")
+        codes, inverse = np.unique(groups[:, 0], return_inverse=True)
+        totals = np.zeros((len(codes), counts.shape[1]), dtype=np.int64)
+        np.add.at(totals, inverse.reshape(-1), counts)
+        result = {values[code]: _count_lists(total) for code, total in zip(codes, totals)}
+        return {key: result[key] for key in sorted(result)}
+
+
+def index_frame(df: pd.DataFrame, file_name: str, separate_users=False) -> AuditTrailIndex:
+    """
+    Index an audit trail loaded in a pandas DataFrame (e.g., with pd.read_csv).
+    :param df: the audit trail, with columns
+            ['Index', 'Event Time', 'Document', 'Tab', 'User', 'Description']
+    :param file_name: the file name of the csv that is being analyzed.
+    :param separate_users: if more than one user is found in the audit trail, would their actions
+                            be queried separately?
+    :return: the index of the audit trail
+    """
+    return AuditTrailIndex([_frame_rows(df, file_name, separate_users)])
+
+
+def index_store(store: columnar_store.AuditTrailStore, file_name: str,
+                separate_users=False) -> AuditTrailIndex:
+    """
+    Same as index_frame, for an audit trail loaded with columnar_store.load_store.
+    """
+    return AuditTrailIndex([_store_rows(store, file_name, separate_users)])
+
+
+def index_directory(directory: str, separate_users=False) -> AuditTrailIndex:
+    """
+    Index every csv audit trail in a directory (and its subdirectories) together, as
+    aggregate_count.aggregate_directory counts them.
+    :param directory: the directory of the audit trail files
+    :param separate_users: if more than one user is found in one csv file, would their actions be
+                            queried separately?
+    :return: the index of the audit trails
+    """
+    return AuditTrailIndex([
+        _frame_rows(pd.read_csv(file_path, dtype=str, keep_default_na=False), file_name,
+                    separate_users)
+        for file_path, file_name in aggregate_count.list_audit_trails(directory)])
@@ -0,0 +1,202 @@
+from action_counting import aggregate_count, columnar_store
+import numpy as np
+import pandas as pd
+from typing import List, Optional, Tuple
+
+# Default inactivity (in seconds) after which a user's activity in a tab is considered interrupted
+ACTIVITY_GAP = 5 * 60
+
+# Columns of the collaboration table: one row per (document, tab, from user, to user)
+COLLABORATION_COLUMNS = ["Document", "Tab", "From User", "To User", "Overlap Seconds",
+                         "Handoffs"]
+
+
+def _sort_order(event_time: np.ndarray, *keys: np.ndarray) -> np.ndarray:
+    """
+    Internal function sorting rows by non-negative integer keys (the last one first) then by event
+    time, as np.lexsort((event_time,) + keys) but faster: when they fit, all keys are combined into
+    a single int64 key sorted at once.
+    """
+    if not len(event_time):
+        return np.arange(0)
+    origin = int(event_time.min())
+    combined, span = event_time - origin, int(event_time.max()) - origin + 1
+    for key in keys:
+        if span * (int(key.max()) + 1) >= 2 ** 63:
+            return np.lexsort((event_time,) + keys)
+        combined = combined + key.astype(np.int64) * span
+        span *= int(key.max()) + 1
+    return np.argsort(combined, kind="stable")
+
+
+def _activity_intervals(group: np.ndarray, user: np.ndarray, event_time: np.ndarray,
+                        gap: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Internal function merging the events of every user in every (document, tab) group into
+    activity intervals: events at most gap seconds apart belong to the same interval, and each
+    event covers its own second.
+    :return: the group, user, start and end (exclusive) of every interval
+    """
+    order = _sort_order(event_time, user, group)
+    group, user, event_time = group[order], user[order], event_time[order]
+    breaks = np.ones(len(order), dtype=bool)
+    breaks[1:] = (group[1:] != group[:-1]) | (user[1:] != user[:-1]) | \
+        (event_time[1:] - event_time[:-1] > gap)
+    firsts = np.flatnonzero(breaks)
+    lasts = np.append(firsts[1:], len(order))[:len(firsts)] - 1
+    return group[firsts], user[firsts], event_time[firsts], event_time[lasts] + 1
+
+
+def _overlaps(group: np.ndarray, user: np.ndarray, start: np.ndarray,
+              end: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Internal sweep computing the time users were active in the same group at the same time.
+    Intervals are sorted by (group, start) once; the intervals overlapping an interval and starting
+    after it are then the following ones up to the first starting at or after its end, found by
+    binary search. Each pair of overlapping intervals is visited once, and pairs of users never
+    active together are never compared, so the cost is O(n log n) plus the number of overlaps.
+    :return: the group, first user, second user and overlap in seconds of every overlap
+    """
+    order = _sort_order(start, group)
+    group, user, start, end = group[order], user[order], start[order], end[order]
+    origin = int(start.min()) if len(start) else 0
+    span = int(end.max()) - origin + 1 if len(end) else 1
+    if (int(group.max()) + 1 if len(group) else 1) * span >= 2 ** 63:
+        raise ValueError("the audit trail spans too long a time")
+    keys = group * span + (start - origin)
+    limits = np.searchsorted(keys, group * span + (end - origin))
+    following = np.maximum(limits - np.arange(1, len(keys) + 1), 0)
+    # Every interval i is paired with the following[i] intervals after it
+    first = np.repeat(np.arange(len(keys)), following)
+    second = first + 1 + np.arange(len(first)) - np.repeat(np.cumsum(following) - following,
+                                                           following)
+    overlap = np.minimum(end[first], end[second]) - start[second]
+    keep = (overlap > 0) & (user[first] != user[second])
+    first, second = first[keep], second[keep]
+    return group[first], user[first], user[second], overlap[keep]
+
+
+def _handoffs(group: np.ndarray, user: np.ndarray, event_time: np.ndarray, gap: int,
+              newest_first: bool) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Internal function finding handoffs: in each group, the next event (within gap seconds) is by
+    another user. Events logged in the same second keep their order in the audit trail, read from
+    the last row up if it lists the newest events first.
+    :return: the group, previous user and next user of every handoff
+    """
+    if newest_first:
+        group, user, event_time = group[::-1], user[::-1], event_time[::-1]
+    order = _sort_order(event_time, group)
+    group, user, event_time = group[order], user[order], event_time[order]
+    handoff = (group[1:] == group[:-1]) & (user[1:] != user[:-1]) & \
+        (event_time[1:] - event_time[:-1] <= gap)
+    following = np.flatnonzero(handoff) + 1
+    return group[following], user[following - 1], user[following]
+
+
+def _collaboration(event_time: np.ndarray, user: np.ndarray, users: np.ndarray,
+                   document: np.ndarray, documents: np.ndarray, tab: np.ndarray,
+                   tabs: np.ndarray, gap: int, newest_first: bool) -> pd.DataFrame:
+    """
+    Internal function computing the collaboration table of encoded audit trail rows.
+    """
+    valid = event_time != columnar_store.MISSING_TIME
+    event_time = np.asarray(event_time)[valid].astype(np.int64)
+    user = np.asarray(user)[valid].astype(np.int64)
+    document, tab = np.asarray(document)[valid].astype(np.int64), np.asarray(tab)[valid]
+    group_ids, group = np.unique(document * len(tabs) + tab, return_inverse=True)
+    group = group.reshape(-1).astype(np.int64)
+
+    overlap_groups, firsts, seconds, overlaps = _overlaps(
+        *_activity_intervals(group, user, event_time, gap))
+    # Overlaps are symmetric: record them in both directions
+    overlap = pd.DataFrame({"group": np.concatenate([overlap_groups, overlap_groups]),
+                            "from": np.concatenate([firsts, seconds]),
+                            "to": np.concatenate([seconds, firsts]),
+                            "Overlap Seconds": np.concatenate([overlaps, overlaps])})
+    handoff_groups, previous, following = _handoffs(group, user, event_time, gap, newest_first)
+    handoff = pd.DataFrame({"group": handoff_groups, "from": previous, "to": following,
+                            "Handoffs": np.ones(len(previous), dtype=np.int64)})
+    table = pd.concat([overlap, handoff]).fillna(0).groupby(["group", "from", "to"]).sum()
+    table = table[["Overlap Seconds", "Handoffs"]].astype(np.int64).reset_index()
+    groups = group_ids[table["group"].to_numpy()]
+    return pd.DataFrame({
+        "Document": np.asarray(documents, dtype=object)[groups // len(tabs)],
+        "Tab": np.asarray(tabs, dtype=object)[groups % len(tabs)],
+        "From User": np.asarray(users, dtype=object)[table["from"].to_numpy()],
+        "To User": np.asarray(users, dtype=object)[table["to"].to_numpy()],
+        "Overlap Seconds": table["Overlap Seconds"].to_numpy(),
+        "Handoffs": table["Handoffs"].to_numpy()}, columns=COLLABORATION_COLUMNS)
+
+
+def collaboration_frame(df: pd.DataFrame, file_name: str, separate_users=True,
+                        gap=ACTIVITY_GAP, newest_first=True) -> pd.DataFrame:
+    """
+    Measure how users work together in every document tab of an audit trail:
+        - overlap: the time two users were both active in the tab, where a user is active from
+            an event until the next one if they are at most gap seconds apart;
+        - handoffs: the number of times the next event in the tab (within gap seconds) was by
+            another user.
+    Activity intervals are built and swept in time order (O(n log n) in the number of events), so
+    only users active in the same tab at the same time are ever paired.
+    :param df: the audit trail, with columns
+            ['Index', 'Event Time', 'Document', 'Tab', 'User', 'Description']
+    :param file_name: the file name of the csv that is being analyzed.
+    :param separate_users: (Optional) would the users be labelled separately? (otherwise, all
+                            actions are by the file and there is no collaboration to measure)
+    :param gap: (Optional) the inactivity in seconds after which a user's activity in a tab is
+                interrupted
+    :param newest_first: (Optional) are the rows ordered from the newest to the oldest event, as in
+                            Onshape exports? (only the order of the events logged in the same second
+                            is taken from the row order)
+    :return: a sparse user x user collaboration table (see COLLABORATION_COLUMNS), with one row per
+            document, tab and pair of users with some overlap or handoffs; overlaps appear in both
+            directions, handoffs from the previous user to the next one
+    """
+    email_codes, emails = pd.factorize(df.iloc[:, 4].astype(str))
+    user_codes, users = aggregate_count.user_keys(file_name, email_codes, emails, separate_users)
+    document_codes, documents = pd.factorize(df.iloc[:, 2].astype(str).str.strip())
+    tab_codes, tabs = pd.factorize(df.iloc[:, 3].astype(str).str.strip())
+    return _collaboration(columnar_store.event_seconds(df.iloc[:, 1]), user_codes, users,
+                          document_codes, documents, tab_codes, tabs, gap, newest_first)
+
+
+def collaboration_store(store: columnar_store.AuditTrailStore, file_name: str,
+                        separate_users=True, gap=ACTIVITY_GAP, newest_first=True) -> pd.DataFrame:
+    """
+    Same as collaboration_frame, for an audit trail loaded with columnar_store.load_store.
+    """
+    user_codes, users = aggregate_count.user_keys(file_name, store.user, store.users,
+                                                  separate_users)
+    # Values differing only in whitespace are merged, as in collaboration_frame
+    document_codes, documents = pd.factorize(pd.Series(store.documents, dtype=str).str.strip())
+    tab_codes, tabs = pd.factorize(pd.Series(store.tabs, dtype=str).str.strip())
+    return _collaboration(store.event_time, user_codes, users, document_codes[store.document],
+                          documents, tab_codes[store.tab], tabs, gap, newest_first)
+
+
+def collaboration_matrix(table: pd.DataFrame, value="Overlap Seconds",
+                         documents: Optional[List[str]] = None,
+                         tabs: Optional[List[str]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Sum a collaboration table over documents and tabs into a dense user x user matrix (e.g., to be
+    plotted as a heatmap). Only the users with some collaboration are included.
+    :param table: the collaboration table computed with collaboration_frame or collaboration_store
+    :param value: (Optional) "Overlap Seconds" or "Handoffs"
+    :param documents: (Optional) the documents to be included; all documents by default
+    :param tabs: (Optional) the tabs to be included; all tabs by default
+    :return: the sorted users, and the matrix whose entry [i, j] is the value from users[i] to
+            users[j]
+    """
+    if documents is not None:
+        table = table[table["Document"].isin(documents)]
+    if tabs is not None:
+        table = table[table["Tab"].isin(tabs)]
+    table = table[table[value] != 0]
+    users = np.unique(np.concatenate([table["From User"].to_numpy(dtype=object),
+                                      table["To User"].to_numpy(dtype=object)]))
+    matrix = np.zeros((len(users), len(users)), dtype=np.int64)
+    np.add.at(matrix, (np.searchsorted(users, table["From User"].to_numpy(dtype=object)),
+                       np.searchsorted(users, table["To User"].to_numpy(dtype=object))),
+              table[value].to_numpy())
+    return users, matrix
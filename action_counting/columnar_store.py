@@ -0,0 +1,118 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from typing import Dict, List, NamedTuple
+
+# Integer type of every column stored in the columnar format: Event Time is stored in seconds since
+# the epoch (-2^63 for missing or invalid times), and the other columns as codes into dictionaries
+COLUMNS = {"Event Time": "int64", "Document": "int32", "Tab": "int32", "User": "int32",
+           "Description": "int32"}
+
+_ENCODED_COLUMNS = ["Document", "Tab", "User", "Description"]
+
+# Event Time of the rows whose time is missing or invalid
+MISSING_TIME = np.iinfo(np.int64).min
+
+# Default number of csv rows converted at a time
+CHUNK_ROWS = 1000000
+
+
+class AuditTrailStore(NamedTuple):
+    """
+    An audit trail loaded from the columnar format. Columns are memory-mapped arrays, and each
+    dictionary-encoded column comes with the list of its distinct values.
+    """
+    event_time: np.ndarray  # int64 seconds since the epoch
+    document: np.ndarray  # codes into documents
+    tab: np.ndarray  # codes into tabs
+    user: np.ndarray  # codes into users
+    description: np.ndarray  # codes into descriptions
+    documents: np.ndarray
+    tabs: np.ndarray
+    users: np.ndarray
+    descriptions: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.event_time)
+
+
+def _column_path(store_path: str, column: str) -> str:
+    return os.path.join(store_path, column.replace(" ", "_").lower() + ".bin")
+
+
+def _encode(values: pd.Series, dictionary: Dict[str, int]) -> np.ndarray:
+    """
+    Internal function dictionary-encoding a column chunk, adding its new values to the dictionary.
+    :param values: the values of the chunk
+    :param dictionary: the codes of the values seen so far, updated in place
+    :return: the codes of the values of the chunk
+    """
+    codes, uniques = pd.factorize(values)
+    mapping = np.empty(len(uniques), dtype=np.int32)
+    for i, value in enumerate(uniques):
+        mapping[i] = dictionary.setdefault(value, len(dictionary))
+    return mapping[codes]
+
+
+def event_seconds(values: pd.Series) -> np.ndarray:
+    """
+    Convert an Event Time column to seconds since the epoch, as stored in the columnar format.
+    :param values: the Event Time values, as exported ("%Y-%m-%d %H:%M:%S")
+    :return: an int64 array of the times in seconds, MISSING_TIME for missing or invalid times
+    """
+    event_time = pd.to_datetime(values, format="%Y-%m-%d %H:%M:%S", errors="coerce")
+    seconds = event_time.to_numpy(dtype="datetime64[s]").astype(np.int64)
+    seconds[event_time.isna().to_numpy()] = MISSING_TIME
+    return seconds
+
+
+def convert_csv(csv_path: str, store_path: str, chunk_rows=CHUNK_ROWS) -> None:
+    """
+    Convert an audit trail from csv to the columnar format, in a directory holding one binary file
+    per column and a JSON metadata file with the dictionaries of the encoded columns. The csv is
+    read in chunks, so files larger than memory can be converted.
+    :param csv_path: the path of the csv file, with columns
+            ['Index', 'Event Time', 'Document', 'Tab', 'User', 'Description']
+    :param store_path: the directory where the columnar audit trail is written (created if missing)
+    :param chunk_rows: (Optional) the number of rows converted at a time
+    """
+    os.makedirs(store_path, exist_ok=True)
+    dictionaries = {column: {} for column in _ENCODED_COLUMNS}
+    files = {column: open(_column_path(store_path, column), 'wb') for column in COLUMNS}
+    rows = 0
+    try:
+        for chunk in pd.read_csv(csv_path, dtype=str, keep_default_na=False, chunksize=chunk_rows):
+            chunk.columns = range(chunk.shape[1])
+            files["Event Time"].write(event_seconds(chunk[1]).tobytes())
+            for index, column in zip((2, 3, 4, 5), _ENCODED_COLUMNS):
+                files[column].write(_encode(chunk[index], dictionaries[column]).tobytes())
+            rows += len(chunk)
+    finally:
+        for column_file in files.values():
+            column_file.close()
+    with open(os.path.join(store_path, "metadata.json"), 'w') as metadata:
+        json.dump({"rows": rows, "columns": COLUMNS,
+                   "dictionaries": {column: list(values)
+                                    for column, values in dictionaries.items()}}, metadata)
+
+
+def load_store(store_path: str) -> AuditTrailStore:
+    """
+    Load an audit trail converted with convert_csv. Columns are memory-mapped rather than read, so
+    loading is nearly instantaneous and the rows are only paged in when used.
+    :param store_path: the directory of the columnar audit trail
+    :return: the columnar audit trail
+    """
+    with open(os.path.join(store_path, "metadata.json"), 'r') as metadata:
+        meta = json.load(metadata)
+    columns = []
+    for column, dtype in meta["columns"].items():
+        if meta["rows"]:
+            columns.append(np.memmap(_column_path(store_path, column), dtype=dtype, mode='r',
+                                     shape=(meta["rows"],)))
+        else:  # zero-length files cannot be memory-mapped
+            columns.append(np.empty(0, dtype=dtype))
+    dictionaries: List[np.ndarray] = [np.array(meta["dictionaries"][column], dtype=object)
+                                      for column in _ENCODED_COLUMNS]
+    return AuditTrailStore(*columns, *dictionaries)
@@ -0,0 +1,188 @@
+from action_classification import action_classification
+import os
+import json
+import time
+import hashlib
+import sqlite3
+from typing import Dict, Optional, Tuple
+
+# Default upper bound on the total size of the counts stored in a cache (in bytes of JSON)
+MAX_BYTES = 256 * 1024 * 1024
+
+_BLOCK_BYTES = 1024 * 1024
+
+# Number of bytes read at a time when searching the last line break of a file backwards
+_LINE_BLOCK_BYTES = 64 * 1024
+
+
+def _hash_file(file_path: str, size: int, prefix_size: int) -> Tuple[str, Optional[str]]:
+    """
+    Internal function hashing the first size bytes of a file in a single read.
+    :param file_path: the path of the file
+    :param size: the number of bytes to hash
+    :param prefix_size: the length of a prefix whose hash is also returned (ignored if not between
+                        0 and size)
+    :return: the digest of the first size bytes, and the digest of the first prefix_size bytes
+    """
+    hasher = hashlib.blake2b(digest_size=20)
+    prefix_digest = None
+    position = 0
+    with open(file_path, 'rb') as audit_trail_csv:
+        for end in (prefix_size, size):
+            while 0 <= end <= size and position < end:
+                block = audit_trail_csv.read(min(_BLOCK_BYTES, end - position))
+                if not block:
+                    break
+                hasher.update(block)
+                position += len(block)
+            if end == prefix_size and 0 <= prefix_size <= size:
+                prefix_digest = hasher.hexdigest()
+    return hasher.hexdigest(), prefix_digest
+
+
+def complete_lines_end(file_path: str, start: int, size: int) -> int:
+    """
+    Find the end of the last complete line of a file, so that a row being appended is not read
+    (or cached as counted) before it is fully written.
+    :param file_path: the path of the file
+    :param start: the first byte to search, on a line boundary
+    :param size: the byte following the last byte to search (e.g., the size of the file)
+    :return: the byte following the last line break between start and size, or start if there is
+            none
+    """
+    with open(file_path, 'rb') as audit_trail_csv:
+        end = size
+        while end > start:
+            first = max(start, end - _LINE_BLOCK_BYTES)
+            audit_trail_csv.seek(first)
+            line_break = audit_trail_csv.read(end - first).rfind(b"\n")
+            if line_break >= 0:
+                return first + line_break + 1
+            end = first
+    return start
+
+
+class CountCache:
+    """
+    On-disk (SQLite) cache of the counts of audit trail files, used to skip unchanged files and to
+    count only the appended rows of append-only files when the pipeline is re-run.
+
+    Entries are keyed by file path, file name and separate_users mode, and validated with the size,
+    modification time and content hash of the file. Entries computed with other classification
+    rules (see action_classification.taxonomy_version) are discarded, and the least recently used
+    entries are evicted once the stored counts exceed max_bytes.
+    """
+
+    def __init__(self, db_path: str, max_bytes=MAX_BYTES):
+        """
+        :param db_path: the path of the SQLite database file (created if missing)
+        :param max_bytes: (Optional) upper bound on the total size of the stored counts
+        """
+        self.max_bytes = max_bytes
+        self.taxonomy = action_classification.taxonomy_version()
+        self._connection = sqlite3.connect(db_path)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS counts (path TEXT, file_name TEXT, separate_users INTEGER, "
+            "taxonomy TEXT, size INTEGER, mtime_ns INTEGER, digest TEXT, counts TEXT, "
+            "n_bytes INTEGER, last_used REAL, PRIMARY KEY (path, file_name, separate_users))")
+        self._connection.execute("DELETE FROM counts WHERE taxonomy != ?", (self.taxonomy,))
+        self._connection.commit()
+        self._digests = {}  # (path, size) -> (digest, mtime_ns) computed by lookup for store
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def lookup(self, file_path: str, file_name: str,
+               separate_users: bool) -> Tuple[Optional[Dict], int, int]:
+        """
+        Look up the stored counts of a file.
+        :param file_path: the path of the csv file
+        :param file_name: the file name used to label the counts
+        :param separate_users: would the users in the csv file be counted separately?
+        :return: (counts, start, end): the stored counts (None if there are none or they are
+                stale), the number of leading bytes of the file they cover and the end of the last
+                complete line of the file (a row still being written is left for the next run).
+                The file is unchanged if start == end, and only bytes start to end remain to be
+                counted and merged otherwise.
+        """
+        path = os.path.abspath(file_path)
+        stat = os.stat(path)
+        row = self._connection.execute(
+            "SELECT size, mtime_ns, digest, counts FROM counts "
+            "WHERE path = ? AND file_name = ? AND separate_users = ?",
+            (path, file_name, int(separate_users))).fetchone()
+        # Only complete lines are covered: the bytes after them are at most one unterminated row
+        if row is not None and row[1] == stat.st_mtime_ns and row[0] <= stat.st_size and \
+                complete_lines_end(path, row[0], stat.st_size) == row[0]:
+            self._touch(path, file_name, separate_users)
+            return json.loads(row[3]), row[0], row[0]
+        # Check the content: the file is either unchanged, appended to, or rewritten
+        end = complete_lines_end(path, 0, stat.st_size)
+        prefix_size = row[0] if row is not None and row[0] <= end else -1
+        digest, prefix_digest = _hash_file(path, end, prefix_size)
+        self._digests[(path, end)] = (digest, stat.st_mtime_ns)
+        if row is None or prefix_digest != row[2]:
+            return None, 0, end
+        if row[0] == end:
+            # Only the modification time changed: record it to skip the content check next time
+            self._touch(path, file_name, separate_users, stat.st_mtime_ns)
+        else:
+            self._touch(path, file_name, separate_users)
+        return json.loads(row[3]), row[0], end
+
+    def store(self, file_path: str, file_name: str, separate_users: bool, counts: Dict,
+              size: int) -> None:
+        """
+        Store the counts of a file, then evict the least recently used entries if needed.
+        :param file_path: the path of the csv file
+        :param file_name: the file name used to label the counts
+        :param separate_users: would the users in the csv file be counted separately?
+        :param counts: the counts of the first size bytes of the file, in the format returned by
+                        aggregate_count
+        :param size: the number of leading bytes of the file covered by counts, on a line
+                        boundary (the end returned by lookup)
+        """
+        path = os.path.abspath(file_path)
+        digest, mtime_ns = self._digests.pop((path, size), (None, None))
+        if digest is None:
+            digest = _hash_file(path, size, -1)[0]
+            mtime_ns = os.stat(path).st_mtime_ns
+        current_size = os.path.getsize(path)
+        if current_size < size or complete_lines_end(path, size, current_size) != size:
+            mtime_ns = -1  # the file changed while being counted: force a content check next time
+        data = json.dumps(counts)
+        self._connection.execute(
+            "INSERT OR REPLACE INTO counts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (path, file_name, int(separate_users), self.taxonomy, size, mtime_ns, digest, data,
+             len(data), time.time()))
+        self._evict()
+        self._connection.commit()
+
+    def _touch(self, path: str, file_name: str, separate_users: bool,
+               mtime_ns: Optional[int] = None) -> None:
+        if mtime_ns is not None:
+            self._connection.execute(
+                "UPDATE counts SET mtime_ns = ? WHERE path = ? AND file_name = ? AND "
+                "separate_users = ?", (mtime_ns, path, file_name, int(separate_users)))
+        self._connection.execute(
+            "UPDATE counts SET last_used = ? WHERE path = ? AND file_name = ? AND "
+            "separate_users = ?", (time.time(), path, file_name, int(separate_users)))
+        self._connection.commit()
+
+    def _evict(self) -> None:
+        total = self._connection.execute(
+            "SELECT COALESCE(SUM(n_bytes), 0) FROM counts").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for rowid, n_bytes in self._connection.execute(
+                "SELECT rowid, n_bytes FROM counts ORDER BY last_used").fetchall():
+            self._connection.execute("DELETE FROM counts WHERE rowid = ?", (rowid,))
+            total -= n_bytes
+            if total <= self.max_bytes:
+                break
@@ -0,0 +1,218 @@
+import os
+import math
+import numpy as np
+import pandas as pd
+from instrumentation import instrumentation
+from action_counting import aggregate_count
+from typing import Dict, List, Optional, Union
+
+# Default expected number of distinct events and false positive rate of a BloomFilter
+BLOOM_CAPACITY = 100 * 1000 * 1000
+BLOOM_ERROR_RATE = 1e-6
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    """
+    Internal function scrambling 64-bit values (the splitmix64 finalizer), used to derive further
+    independent hashes from an event hash.
+    """
+    values = values.astype(np.uint64)
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def event_hashes(chunk: pd.DataFrame) -> np.ndarray:
+    """
+    Hash the events of audit trail rows: two rows are the same event if their Event Time, Document,
+    Tab, User and Description are equal (as exported; the row index is ignored).
+    :param chunk: the audit trail rows, with columns
+            ['Index', 'Event Time', 'Document', 'Tab', 'User', 'Description']
+    :return: the 64-bit hash of the event of every row
+    """
+    hashes = pd.util.hash_pandas_object(chunk.iloc[:, 1:6].astype(str), index=False)
+    return hashes.to_numpy().copy()
+
+
+def _sorted_unique(values: np.ndarray, kind="quicksort") -> np.ndarray:
+    """
+    Internal function sorting values and removing duplicates (as np.unique, whose hash-based
+    implementation is slower on 64-bit hashes).
+    """
+    values = np.sort(values, kind=kind)
+    keep = np.ones(len(values), dtype=bool)
+    keep[1:] = values[1:] != values[:-1]
+    return values[keep]
+
+
+class EventSet:
+    """
+    Exact set of event hashes, stored as sorted numpy arrays of 8 bytes per event (instead of a
+    Python set of tuples of strings). Added hashes form runs of geometrically decreasing sizes,
+    merged as they grow, so adding n events costs O(n log n) and a lookup searches O(log n) runs.
+    """
+
+    def __init__(self):
+        self.runs: List[np.ndarray] = []
+
+    def __len__(self) -> int:
+        return sum(len(run) for run in self.runs)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        The memory used by the set, in bytes.
+        """
+        return sum(run.nbytes for run in self.runs)
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        """
+        Look up event hashes.
+        :param hashes: the event hashes to look up
+        :return: a boolean array, True for the hashes found in the set
+        """
+        found = np.zeros(len(hashes), dtype=bool)
+        for run in self.runs:
+            positions = np.minimum(np.searchsorted(run, hashes), len(run) - 1)
+            found |= run[positions] == hashes
+        return found
+
+    def add(self, hashes: np.ndarray) -> None:
+        """
+        Add event hashes to the set.
+        :param hashes: the event hashes to be added
+        """
+        if not len(hashes):
+            return
+        self.runs.append(_sorted_unique(hashes.astype(np.uint64)))
+        while len(self.runs) > 1 and len(self.runs[-2]) <= 2 * len(self.runs[-1]):
+            last = self.runs.pop()
+            # Timsort merges the two sorted runs in linear time
+            self.runs[-1] = _sorted_unique(np.concatenate([self.runs[-1], last]), kind="stable")
+
+
+class BloomFilter:
+    """
+    Probabilistic set of event hashes using a fixed amount of memory, for merges too large for an
+    EventSet: lookups never miss an added event, but find an event never added with probability
+    about error_rate (such a new event would then be dropped as a duplicate) as long as at most
+    capacity events are added.
+    """
+
+    def __init__(self, capacity=BLOOM_CAPACITY, error_rate=BLOOM_ERROR_RATE):
+        """
+        :param capacity: (Optional) the expected number of distinct events
+        :param error_rate: (Optional) the false positive rate at capacity
+        """
+        if capacity < 1 or not 0 < error_rate < 1:
+            raise ValueError("capacity must be positive and error_rate between 0 and 1")
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hash_count = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        The memory used by the filter, in bytes.
+        """
+        return self.bits.nbytes
+
+    def _positions(self, hashes: np.ndarray) -> np.ndarray:
+        """
+        Internal function computing the bits of event hashes, by double hashing.
+        :return: an array of shape (len(hashes), hash_count) of bit positions
+        """
+        hashes = hashes.astype(np.uint64)
+        step = _mix(hashes) | np.uint64(1)
+        rounds = np.arange(self.hash_count, dtype=np.uint64)
+        return (hashes[:, None] + rounds[None, :] * step[:, None]) % np.uint64(self.size)
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        """
+        Look up event hashes.
+        :param hashes: the event hashes to look up
+        :return: a boolean array, True for the hashes (probably) found in the filter
+        """
+        positions = self._positions(hashes)
+        masks = np.uint8(1) << (positions & np.uint64(7)).astype(np.uint8)
+        return ((self.bits[positions >> np.uint64(3)] & masks) != 0).all(axis=1)
+
+    def add(self, hashes: np.ndarray) -> None:
+        """
+        Add event hashes to the filter.
+        :param hashes: the event hashes to be added
+        """
+        positions = self._positions(hashes).reshape(-1)
+        np.bitwise_or.at(self.bits, positions >> np.uint64(3),
+                         np.uint8(1) << (positions & np.uint64(7)).astype(np.uint8))
+
+
+def _occurrences(hashes: np.ndarray, in_file: EventSet, repeats: Dict[int, int]) -> np.ndarray:
+    """
+    Internal function numbering the occurrences of every event within an audit trail file: 0 for
+    its first row, 1 for the second... Only the (rare) repeated events are numbered one by one.
+    :param hashes: the event hashes of the next rows of the file
+    :param in_file: the hashes of the previous rows of the file, updated in place
+    :param repeats: the number of rows so far of the repeated events of the file, updated in place
+    :return: the occurrence of every row
+    """
+    earlier = in_file.contains(hashes)
+    repeated = earlier | pd.Series(hashes).duplicated(keep=False).to_numpy()
+    occurrences = np.zeros(len(hashes), dtype=np.uint64)
+    for i in np.flatnonzero(repeated):
+        event = int(hashes[i])
+        occurrence = repeats.get(event, 1 if earlier[i] else 0)
+        occurrences[i] = occurrence
+        repeats[event] = occurrence + 1
+    in_file.add(hashes)
+    return occurrences
+
+
+def aggregate_unique(directory: str, separate_users=False, merge_users=False,
+                     seen: Optional[Union[EventSet, BloomFilter]] = None,
+                     chunk_bytes=aggregate_count.CHUNK_BYTES) -> Dict:
+    """
+    Aggregate count of actions of every csv audit trail in a directory (and its subdirectories)
+    whose exports may overlap (e.g., overlapping date ranges, or both per-user and combined exports
+    of the same document), counting every event once. The files are read once, in sorted order,
+    and the events already counted in a previous file are skipped; an event logged k times within
+    one file (e.g., the same action repeated within a second) is counted k times, and only its
+    rows beyond the number already counted are counted from another file.
+    :param directory: the directory of the audit trail files
+    :param separate_users: if more than one user is found in one csv file, would their counts be
+                            counted separately?
+    :param merge_users: (Optional) with separate_users, would the counts of the same user in
+                        different files be merged? The users are then labelled without the file
+                        name.
+    :param seen: (Optional) the events already counted (e.g., by a previous call), updated in
+                    place; a BloomFilter bounds the memory used for very large merges, at the cost
+                    of dropping about its error rate of the events. Defaults to a new EventSet.
+    :param chunk_bytes: (Optional) the number of bytes of csv text parsed at a time
+    :return: a dictionary of counts in the same format as aggregate_count, ordered by file/user
+            name
+    """
+    if seen is None:
+        seen = EventSet()
+    counts = {}
+    for file_path, file_name in aggregate_count.list_audit_trails(directory):
+        if not separate_users:
+            counts.setdefault(file_name, aggregate_count.new_count())
+        in_file, repeats = EventSet(), {}
+        for chunk in aggregate_count.read_chunks(file_path, 0, os.path.getsize(file_path),
+                                                  chunk_bytes):
+            with instrumentation.stage("deduplicate", rows=len(chunk)):
+                hashes = event_hashes(chunk)
+                occurrences = _occurrences(hashes, in_file, repeats)
+                # The k-th occurrence of an event is a distinct event, so that repeated events
+                # are matched occurrence by occurrence across files
+                repeated = occurrences != 0
+                hashes[repeated] = _mix(hashes[repeated] + occurrences[repeated] * _GOLDEN)
+                new = ~seen.contains(hashes)
+                seen.add(hashes[new])
+            partial = aggregate_count.aggregate_count_frame(chunk[new], file_name, separate_users)
+            if separate_users and merge_users:
+                partial = {user[len(file_name) + 1:]: count for user, count in partial.items()}
+            aggregate_count.merge_counts(counts, partial)
+    return {key: counts[key] for key in sorted(counts)}
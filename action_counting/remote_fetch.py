@@ -0,0 +1,211 @@
+from instrumentation import instrumentation
+from action_counting import aggregate_count
+import io
+import os
+import time
+import random
+import asyncio
+import http.client
+import pandas as pd
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+# HTTP statuses worth retrying: the server is overloaded or temporarily failing
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class FetchError(Exception):
+    """
+    A page could not be fetched, even after retrying.
+    """
+
+
+class _ConnectionPool:
+    """
+    Internal pool of persistent (keep-alive) HTTP connections to one host. Requests are blocking
+    http.client calls run in a thread pool, one connection per thread, so at most size requests
+    are in flight and connections are reused across pages.
+    """
+
+    def __init__(self, url: str, size: int, timeout: float):
+        parts = urlsplit(url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == "https" else \
+            http.client.HTTPConnection
+        self._idle = asyncio.Queue()
+        for _ in range(size):
+            self._idle.put_nowait(connection_class(parts.netloc, timeout=timeout))
+        self._executor = ThreadPoolExecutor(max_workers=size)
+
+    @staticmethod
+    def _request(connection: http.client.HTTPConnection, path: str,
+                 headers: Dict[str, str]) -> Tuple[int, Dict[str, str], bytes]:
+        try:
+            connection.request("GET", path, headers=headers)
+            response = connection.getresponse()
+            return response.status, dict(response.getheaders()), response.read()
+        except Exception:
+            connection.close()  # reconnects on the next request
+            raise
+
+    async def get(self, path: str, headers: Dict[str, str]) -> Tuple[int, Dict[str, str], bytes]:
+        """
+        :return: the status, headers and body of the response to a GET request of path
+        """
+        connection = await self._idle.get()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._request, connection, path, headers)
+        finally:
+            self._idle.put_nowait(connection)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+        while not self._idle.empty():
+            self._idle.get_nowait().close()
+
+
+def page_path(url: str, page: int, page_parameter="page") -> str:
+    """
+    Default pagination scheme of fetch_count: the page number is a query parameter of the url.
+    :param url: the url of the audit trail export (possibly with other query parameters)
+    :param page: the page number
+    :param page_parameter: (Optional) the name of the query parameter
+    :return: the path and query of the page, relative to the host of url
+    """
+    parts = urlsplit(url)
+    query = [(name, value) for name, value in parse_qsl(parts.query) if name != page_parameter]
+    query.append((page_parameter, str(page)))
+    return urlunsplit(("", "", parts.path or "/", urlencode(query), ""))
+
+
+async def _fetch_page(pool: _ConnectionPool, path: str, headers: Dict[str, str], retries: int,
+                      backoff: float) -> Optional[bytes]:
+    """
+    Internal function fetching a page, retrying connection errors and RETRY_STATUSES responses
+    with exponential backoff (and jitter, or the delay of a Retry-After header).
+    :return: the body of the page, or None if the page does not exist (404)
+    """
+    for attempt in range(retries + 1):
+        delay = backoff * 2 ** attempt * (0.5 + random.random())
+        try:
+            status, response_headers, body = await pool.get(path, headers)
+        except (OSError, http.client.HTTPException) as error:
+            if attempt == retries:
+                raise FetchError("{}: {}".format(path, error)) from error
+        else:
+            if status == 200:
+                return body
+            if status == 404:
+                return None
+            if status not in RETRY_STATUSES or attempt == retries:
+                raise FetchError("{}: HTTP {}".format(path, status))
+            retry_after = response_headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                delay = float(retry_after)
+        await asyncio.sleep(delay)
+
+
+def _count_page(body: bytes, file_name: str, separate_users: bool) -> Tuple[Dict, int]:
+    """
+    Internal worker function counting the rows of a page, a csv with the header of the audit trails
+    (run in a worker process, off the event loop).
+    :return: the counts of the page in the format returned by aggregate_count, and its number of
+            rows
+    """
+    with instrumentation.stage("parse") as timer:
+        df = pd.read_csv(io.BytesIO(body), dtype=str, keep_default_na=False)
+        if timer is not None:
+            timer.rows = len(df)
+    if df.empty:
+        return {}, 0
+    return aggregate_count.aggregate_count_frame(df, file_name, separate_users), len(df)
+
+
+async def fetch_count_async(url: str, file_name: str, separate_users=False, concurrency=4,
+                            retries=3, backoff=0.5, timeout=30.0,
+                            headers: Optional[Dict[str, str]] = None, first_page=0,
+                            page: Callable[[str, int], str] = page_path,
+                            progress: Optional[Callable[[int, float], None]] = None,
+                            jobs: Optional[int] = None) -> Dict:
+    """
+    Coroutine fetching a paginated audit trail export over HTTP and counting it as it arrives
+    (see fetch_count).
+    """
+    headers = dict(headers or {})
+    pool = _ConnectionPool(url, concurrency, timeout)
+    executor = ProcessPoolExecutor(max_workers=jobs or os.cpu_count() or 1)
+    counts = {file_name: aggregate_count.new_count()} if not separate_users else {}
+    next_page = first_page
+    end_page = None  # the first empty or missing page, once one was found
+    rows = 0
+    start_time = time.perf_counter()
+
+    async def worker() -> None:
+        nonlocal next_page, end_page, rows
+        while end_page is None or next_page < end_page:
+            number = next_page
+            next_page += 1
+            body = await _fetch_page(pool, page(url, number), headers, retries, backoff)
+            partial, page_rows = {}, 0
+            if body:
+                # Parsing and classifying are CPU-bound: done on the event loop, they would stall
+                # the requests of the other workers
+                future = asyncio.wrap_future(instrumentation.submit_worker(
+                    executor, _count_page, body, file_name, separate_users))
+                await future
+                partial, page_rows = instrumentation.worker_result(future)
+            if page_rows == 0:
+                end_page = number if end_page is None else min(end_page, number)
+            elif end_page is None or number < end_page:
+                # Pages after the end are fetched speculatively and ignored
+                aggregate_count.merge_counts(counts, partial)
+                rows += page_rows
+                if progress is not None:
+                    progress(rows, rows / max(time.perf_counter() - start_time, 1e-9))
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        pool.close()
+        executor.shutdown()
+    return counts
+
+
+def fetch_count(url: str, file_name: str, separate_users=False, concurrency=4, retries=3,
+                backoff=0.5, timeout=30.0, headers: Optional[Dict[str, str]] = None, first_page=0,
+                page: Callable[[str, int], str] = page_path,
+                progress: Optional[Callable[[int, float], None]] = None,
+                jobs: Optional[int] = None) -> Dict:
+    """
+    Fetch a paginated audit trail export over HTTP and count it, without writing it to disk. Up to
+    concurrency pages are downloaded at a time over a pool of keep-alive connections, and every
+    page is counted as soon as it arrives by a pool of worker processes, so parsing overlaps with
+    the download of the next pages. Each page is a csv with the header of the audit trails; pages
+    are numbered from first_page and the first page without rows (or missing, HTTP 404) ends the
+    export.
+    Note: on platforms starting worker processes by spawning (Windows, macOS), the calling script
+    must be protected by if __name__ == "__main__":.
+    :param url: the url of the export (http or https), e.g., "http://localhost:8000/audit_trail"
+    :param file_name: the file name used to label the counts
+    :param separate_users: if more than one user is found in the export, would their counts be
+                            counted separately?
+    :param concurrency: (Optional) the maximum number of pages downloaded at a time
+    :param retries: (Optional) the number of times a page is retried after a connection error or a
+                    retryable status (RETRY_STATUSES) before FetchError is raised
+    :param backoff: (Optional) the base delay in seconds between retries, doubled at every retry
+    :param timeout: (Optional) the timeout of the connections in seconds
+    :param headers: (Optional) the HTTP headers sent with every request (e.g., authorization)
+    :param first_page: (Optional) the number of the first page
+    :param page: (Optional) a function returning the path and query of a page from url and the
+                    page number; by default the number is the "page" query parameter (page_path)
+    :param progress: (Optional) a function called with the number of rows counted so far and the
+                        throughput in rows per second after every page (e.g.,
+                        aggregate_count.print_progress)
+    :param jobs: (Optional) the number of worker processes counting the pages; defaults to the
+                    number of CPUs
+    :return: a dictionary of counts in the same format as aggregate_count
+    """
+    return asyncio.run(fetch_count_async(url, file_name, separate_users, concurrency, retries,
+                                         backoff, timeout, headers, first_page, page, progress,
+                                         jobs))
@@ -0,0 +1,182 @@
+import pandas as pd
+from collections import OrderedDict
+from itertools import groupby
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+
+# Default inactivity (in seconds) after which a session is considered over
+IDLE_GAP = 30 * 60
+
+_EPOCH = datetime(1970, 1, 1)
+_SECOND = timedelta(seconds=1)
+
+
+class Session(NamedTuple):
+    """
+    A working session of a user in a document, from the first to the last event of the session.
+    """
+    user: str  # file/user name, as in aggregate_count
+    document: str
+    start: datetime
+    end: datetime
+    events: int
+    tab_seconds: Dict[str, int]  # time each tab stayed open during the session
+
+    @property
+    def seconds(self) -> int:
+        return int((self.end - self.start) / _SECOND)
+
+
+class _OpenSession:
+    """
+    Internal state of a session not closed yet. Times are in seconds, in the direction of the
+    stream (negated for newest-first audit trails, so that they always increase).
+    """
+    __slots__ = ("start", "last", "events", "closed", "tabs", "tab_closes", "tab_seconds")
+
+    def __init__(self, start: int):
+        self.start = start
+        self.last = start
+        self.events = 0
+        self.closed = False
+        self.tabs = {}  # tab -> time it was opened
+        self.tab_closes = {}  # tab -> time it was last closed
+        self.tab_seconds = {}
+
+
+def segment_sessions(reader: iter, file_name: str, separate_users=False, idle_gap=IDLE_GAP,
+                     newest_first=True) -> Iterator[Session]:
+    """
+    Reconstruct the sessions of every user in every document of an audit trail in a single pass,
+    from "Open document"/"Close document" and tab "opened"/"closed" events. A session also ends
+    after idle_gap seconds without events, and any event outside a session starts one. Rows without
+    a valid Event Time are skipped. Only the sessions currently open are kept in memory.
+    :param reader: the csv reader of the audit trail file (the header is skipped).
+    :param file_name: the file name of the csv that is being analyzed.
+    :param separate_users: if more than one user is found in one csv file, would their sessions be
+                            labelled separately?
+    :param idle_gap: (Optional) the inactivity in seconds after which a session ends
+    :param newest_first: (Optional) are the rows ordered from the newest to the oldest event, as in
+                            Onshape exports? Otherwise they must be in chronological order.
+                            Rows out of order (e.g., several concatenated exports) end the
+                            sessions they would extend backwards.
+    :return: the sessions, in the order they end in the stream
+    """
+    # Reading newest-first rows is reading the trail backwards in time: negating the times keeps
+    # them increasing, and every opening event becomes a closing one and vice versa
+    sign = -1 if newest_first else 1
+    opening, closing = ("Close document", "Open document") if newest_first else \
+        ("Open document", "Close document")
+    tab_opening, tab_closing = (" closed by ", " opened by ") if newest_first else \
+        (" opened by ", " closed by ")
+    sessions = OrderedDict()  # (user, document) -> open session, least recently active first
+    users = {}
+
+    def close(key: Tuple[str, str], session: _OpenSession) -> Session:
+        for tab, opened in session.tabs.items():  # tabs left open close with the session
+            session.tab_seconds[tab] = session.tab_seconds.get(tab, 0) + session.last - opened
+        start, end = sorted((sign * session.start, sign * session.last))
+        return Session(key[0], key[1], _EPOCH + start * _SECOND, _EPOCH + end * _SECOND,
+                       session.events, session.tab_seconds)
+
+    def rank(row: List[str]) -> int:
+        # Within one second, document then tab openings are handled first, and tab then document
+        # closings last, so that the result does not depend on the order of the rows
+        action = row[5].strip()
+        if action.startswith("Tab "):
+            return 1 if tab_opening in action else 3 if tab_closing in action else 2
+        return 0 if action == opening else 4 if action == closing else 2
+
+    next(reader)
+    # Events logged in the same second are listed in no particular order
+    for time_text, same_second in groupby(reader, key=lambda row: row[1]):
+        try:
+            now = sign * ((datetime.fromisoformat(time_text.strip()) - _EPOCH) // _SECOND)
+        except ValueError:
+            continue  # rows without a valid Event Time cannot be placed in a session
+        # Sessions idle for longer than idle_gap are over
+        while sessions:
+            key, session = next(iter(sessions.items()))
+            if now - session.last <= idle_gap:
+                break
+            del sessions[key]
+            yield close(key, session)
+        for row in sorted(same_second, key=rank):
+            if separate_users:
+                user = users.get(row[4])
+                if user is None:
+                    user = users[row[4]] = file_name + '/' + row[4].strip().split("@")[0]
+            else:
+                user = file_name
+            key = (user, row[2].strip())
+            action = row[5].strip()
+            session = sessions.get(key)
+            # A session ends after its closing event, when a new one is opened without closing it,
+            # after an idle gap, or if time goes backwards (e.g., in concatenated exports)
+            if session is not None and (session.closed or
+                                        action == opening and now > session.start or
+                                        not 0 <= now - session.last <= idle_gap):
+                del sessions[key]
+                yield close(key, session)
+                session = None
+            if session is None:
+                session = sessions[key] = _OpenSession(now)
+            else:
+                sessions.move_to_end(key)
+            session.last = now
+            session.events += 1
+            if action.startswith("Tab "):
+                tab = row[3].strip()
+                if tab_opening in action:
+                    session.tabs.setdefault(tab, now)
+                elif tab_closing in action:
+                    # A tab closed again extends its last opening (as a tab opened again is open
+                    # since its first opening), and a tab closed without being opened in the
+                    # session was open since its start
+                    opened = session.tabs.pop(tab, None)
+                    if opened is None:
+                        opened = session.tab_closes.get(tab, session.start)
+                    session.tab_seconds[tab] = session.tab_seconds.get(tab, 0) + now - opened
+                    session.tab_closes[tab] = now
+            elif action == closing:
+                session.closed = True
+    for key, session in sessions.items():
+        yield close(key, session)
+
+
+def session_summary(reader: iter, file_name: str, separate_users=False,
+                    idle_gap=IDLE_GAP, newest_first=True) -> Dict[str, List[float]]:
+    """
+    Summarize the sessions of every file/user of an audit trail (see segment_sessions).
+    :return: a dictionary mapping each file/user name (as in aggregate_count) to
+            [number of sessions, session hours, hours tabs were open]
+    """
+    summary = {}
+    for session in segment_sessions(reader, file_name, separate_users, idle_gap, newest_first):
+        totals = summary.setdefault(session.user, [0, 0.0, 0.0])
+        totals[0] += 1
+        totals[1] += session.seconds / 3600
+        totals[2] += sum(session.tab_seconds.values()) / 3600
+    return summary
+
+
+def add_session_columns(df: pd.DataFrame, summary: Dict[str, List[float]],
+                        name_column="File Name") -> pd.DataFrame:
+    """
+    Add session columns to a counts table (e.g., read from Counts.csv): "Sessions",
+    "Session Hours", "Tab Hours", and "Actions per Session Hour" (the "Total" count divided by the
+    session hours, if the table has a "Total" column).
+    :param df: data read from Counts.csv in pandas DataFrame
+    :param summary: the session summary computed with session_summary
+    :param name_column: (Optional) the name of the file/user name column of df
+    :return: a copy of df with the session columns
+    """
+    df = df.copy()
+    names = df[name_column]
+    df["Sessions"] = [summary.get(name, [0, 0.0, 0.0])[0] for name in names]
+    df["Session Hours"] = [summary.get(name, [0, 0.0, 0.0])[1] for name in names]
+    df["Tab Hours"] = [summary.get(name, [0, 0.0, 0.0])[2] for name in names]
+    if "Total" in df:
+        df["Actions per Session Hour"] = df["Total"] / df["Session Hours"].where(
+            df["Session Hours"] > 0)
+    return df
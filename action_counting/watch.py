@@ -0,0 +1,260 @@
+from action_classification import action_classification
+from action_counting import aggregate_count, count_cache
+import os
+import csv
+import time
+import argparse
+import tempfile
+from typing import Callable, Dict, List, Optional
+
+# Header of the counts csv written by test.py and by the watch mode
+COUNTS_HEADER = ["File Name"] + [category for definition in action_classification.TAXONOMIES
+                                  for category in definition.categories]
+
+# Number of bytes before the read offset of a file compared at every change, to detect rewrites
+_TAIL_BYTES = 64
+
+
+def write_counts_csv(counts: Dict, output_path: str, name_column="File Name") -> None:
+    """
+    Write counts to a csv file (in the Counts.csv format of test.py) atomically: the rows are
+    written to a temporary file in the same directory, which then replaces the output, so readers
+    never see a partially written file. The output keeps its permissions (a new one gets the
+    default permissions of the umask), not the owner-only ones of the temporary file.
+    :param counts: the counts in the format returned by aggregate_count
+    :param output_path: the path of the csv file
+    :param name_column: (Optional) the name of the file/user name column
+    """
+    directory = os.path.dirname(os.path.abspath(output_path))
+    descriptor, temporary_path = tempfile.mkstemp(suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(descriptor, 'w', newline='') as record_csv:
+            writer = csv.writer(record_csv)
+            writer.writerow([name_column] + COUNTS_HEADER[1:])
+            for name, count_list in counts.items():
+                writer.writerow([name] + sum(count_list, []))
+        os.chmod(temporary_path, _file_mode(output_path))
+        os.replace(temporary_path, output_path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+
+def _file_mode(path: str) -> int:
+    """
+    Internal function returning the permission bits of a file, or those a new file gets from the
+    umask if it does not exist.
+    """
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def _read_tail(file_path: str, offset: int) -> bytes:
+    with open(file_path, 'rb') as audit_trail_csv:
+        audit_trail_csv.seek(max(0, offset - _TAIL_BYTES))
+        return audit_trail_csv.read(min(offset, _TAIL_BYTES))
+
+
+class _WatchedFile:
+    """
+    Internal state of a watched audit trail: its counts so far and where to resume reading.
+    """
+    __slots__ = ("identity", "size", "mtime_ns", "offset", "tail", "counts")
+
+    def __init__(self, identity: tuple):
+        self.identity = identity
+        self.size = self.mtime_ns = -1
+        self.offset = 0  # the first byte not counted yet (on a line boundary)
+        self.tail = b""  # the bytes preceding offset
+        self.counts = {}
+
+
+class DirectoryWatcher:
+    """
+    Incremental counts of the csv audit trails of a directory (and its subdirectories) that are
+    appended to over time. Every poll only reads the bytes appended since the previous poll, so
+    its cost is proportional to the new rows rather than to the whole history. Files that shrink,
+    are replaced or whose counted bytes change are counted again from the start, and deleted files
+    are dropped.
+    """
+
+    def __init__(self, directory: str, separate_users=False,
+                 cache: Optional[count_cache.CountCache] = None):
+        """
+        :param directory: the directory of the audit trail files
+        :param separate_users: if more than one user is found in one csv file, would their counts
+                                be counted separately?
+        :param cache: (Optional) if given, the counts of the files found at start-up are read from
+                        the cache (counting only what was appended since), and stored back by
+                        store
+        """
+        self.directory = directory
+        self.separate_users = separate_users
+        self.cache = cache
+        self._files: Dict[str, _WatchedFile] = {}
+        self._names: Dict[str, str] = {}
+
+    def poll(self) -> bool:
+        """
+        Count the rows appended to the audit trails since the previous poll, and pick up new,
+        rewritten and deleted files.
+        :return: did any count change?
+        """
+        changed = False
+        found = set()
+        for file_path, file_name in aggregate_count.list_audit_trails(self.directory):
+            found.add(file_path)
+            try:
+                changed |= self._poll_file(file_path, file_name)
+            except FileNotFoundError:  # deleted between the listing and the read
+                found.discard(file_path)
+        for file_path in set(self._files) - found:
+            del self._files[file_path]
+            del self._names[file_path]
+            changed = True
+        return changed
+
+    def _poll_file(self, file_path: str, file_name: str) -> bool:
+        stat = os.stat(file_path)
+        state = self._files.get(file_path)
+        if state is not None and state.size == stat.st_size and state.mtime_ns == stat.st_mtime_ns:
+            return False
+        changed = False
+        if state is not None and (state.identity != (stat.st_dev, stat.st_ino) or
+                                  stat.st_size < state.offset or
+                                  _read_tail(file_path, state.offset) != state.tail):
+            state = None  # rewritten rather than appended to
+            changed = True
+        if state is None:
+            state = self._files[file_path] = _WatchedFile((stat.st_dev, stat.st_ino))
+            self._names[file_path] = file_name
+            if self.cache is not None:
+                stored, start, _ = self.cache.lookup(file_path, file_name, self.separate_users)
+                if stored is not None:
+                    state.counts, state.offset = stored, start
+                    state.tail = _read_tail(file_path, start)
+                    changed = True
+        state.size, state.mtime_ns = stat.st_size, stat.st_mtime_ns
+        end = count_cache.complete_lines_end(file_path, state.offset, stat.st_size)
+        if end > state.offset:
+            aggregate_count.merge_counts(state.counts, aggregate_count.count_file(
+                file_path, file_name, self.separate_users, state.offset, end))
+            state.offset = end
+            state.tail = _read_tail(file_path, end)
+            changed = True
+        # A last row without a final line break is counted by counts, which it may have changed
+        return changed or end < stat.st_size
+
+    def counts(self) -> Dict:
+        """
+        :return: the current counts, merged over all files, in the same format as aggregate_count
+                and ordered by file/user name
+        """
+        counts = {}
+        for file_path, state in self._files.items():
+            aggregate_count.merge_counts(counts, state.counts)
+            # The last row of a file without a final line break, never added to state.counts since
+            # it may still be being written
+            try:
+                aggregate_count.merge_counts(counts, aggregate_count.count_tail(
+                    file_path, self._names[file_path], self.separate_users, state.offset))
+            except FileNotFoundError:  # deleted since the last poll
+                pass
+        return {key: counts[key] for key in sorted(counts)}
+
+    def store(self) -> None:
+        """
+        Store the counts of every file in the cache given at construction (this hashes the counted
+        bytes of every file, so it is meant to be called when the watch stops).
+        """
+        if self.cache is None:
+            return
+        for file_path, state in self._files.items():
+            self.cache.store(file_path, self._names[file_path], self.separate_users, state.counts,
+                             state.offset)
+
+
+def watch_directory(directory: str, output_path: str, separate_users=False, interval=1.0,
+                    debounce=5.0, cache: Optional[count_cache.CountCache] = None,
+                    on_write: Optional[Callable[[Dict], None]] = None,
+                    stop: Optional[Callable[[], bool]] = None) -> Dict:
+    """
+    Watch a directory of audit trails that are appended to (e.g., Onshape Analytics exports) and
+    keep a counts csv up to date: new rows are counted every interval seconds, and the csv is
+    rewritten atomically (see write_counts_csv) when counts changed, at most once every debounce
+    seconds. Runs until stop returns True or the process is interrupted (Ctrl+C), then writes the
+    final counts.
+    :param directory: the directory of the audit trail files
+    :param output_path: the path of the counts csv (e.g., sample_outputs/Counts.csv)
+    :param separate_users: if more than one user is found in one csv file, would their counts be
+                            counted separately?
+    :param interval: (Optional) the number of seconds between two polls of the directory
+    :param debounce: (Optional) the minimum number of seconds between two writes of the csv
+    :param cache: (Optional) a count cache used to resume from the counts of a previous run (see
+                    DirectoryWatcher)
+    :param on_write: (Optional) a function called with the counts every time the csv is written
+    :param stop: (Optional) a function called after every poll, stopping the watch if it returns
+                    True
+    :return: the final counts, in the same format as aggregate_count
+    """
+    watcher = DirectoryWatcher(directory, separate_users, cache)
+    last_write = float("-inf")
+    pending = True  # the csv is written after the first poll even if it found nothing
+
+    def write() -> Dict:
+        nonlocal last_write, pending
+        counts = watcher.counts()
+        write_counts_csv(counts, output_path)
+        last_write, pending = time.monotonic(), False
+        if on_write is not None:
+            on_write(counts)
+        return counts
+
+    try:
+        while True:
+            pending |= watcher.poll()
+            if pending and time.monotonic() - last_write >= debounce:
+                write()
+            if stop is not None and stop():
+                break
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    counts = write() if pending else watcher.counts()
+    watcher.store()
+    return counts
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command line entry point (see run_watch.py).
+    :param argv: (Optional) the command line arguments; defaults to sys.argv[1:]
+    :return: the exit status
+    """
+    parser = argparse.ArgumentParser(
+        description="Keep the counts of a directory of growing audit trails up to date.")
+    parser.add_argument("directory", help="directory of the csv audit trails")
+    parser.add_argument("output", help="counts csv to keep up to date")
+    parser.add_argument("--separate-users", action="store_true",
+                        help="count the users of each csv file separately")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between two polls")
+    parser.add_argument("--debounce", type=float, default=5.0,
+                        help="minimum seconds between two writes of the output")
+    parser.add_argument("--cache", help="SQLite count cache to resume from and update on exit")
+    args = parser.parse_args(argv)
+
+    def report(counts: Dict) -> None:
+        print("{} updated ({:,} files/users)".format(args.output, len(counts)), flush=True)
+
+    if args.cache:
+        with count_cache.CountCache(args.cache) as cache:
+            watch_directory(args.directory, args.output, args.separate_users, args.interval,
+                            args.debounce, cache, on_write=report)
+    else:
+        watch_directory(args.directory, args.output, args.separate_users, args.interval,
+                        args.debounce, on_write=report)
+    return 0
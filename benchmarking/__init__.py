@@ -0,0 +1,3 @@
+from benchmarking import synthetic_audit_trail
+from benchmarking import page_server
+from benchmarking import benchmark
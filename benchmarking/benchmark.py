@@ -0,0 +1,257 @@
+from action_classification import action_classification
+from action_counting import aggregate_count, activity_series, columnar_store, remote_fetch, \
+    sessions
+from action_count_plotting import plotting, batch_rendering
+from benchmarking import page_server, synthetic_audit_trail
+import os
+import csv
+import json
+import time
+import tempfile
+import argparse
+import tracemalloc
+import pandas as pd
+from typing import Callable, Dict, Iterator, List, Tuple
+
+# Default largest file (in rows) whose descriptions and DataFrame are loaded in memory for the
+# in-memory benchmarks; larger files only run the streaming benchmarks
+MAX_LOADED_ROWS = 5 * 1000 * 1000
+
+_BLOCK_BYTES = 1024 * 1024
+
+
+def _stream_rows(path: str) -> Iterator[List[str]]:
+    """
+    Internal generator reading the rows of an audit trail file (including the header) one at a
+    time, so that benchmarks of the row-based functions do not hold the file in memory.
+    """
+    with open(path, 'r') as audit_trail_csv:
+        yield from csv.reader(audit_trail_csv)
+
+
+def _count_rows(path: str) -> int:
+    """
+    Internal function counting the rows of an audit trail file (excluding the header) by counting
+    its line breaks, without parsing it.
+    """
+    line_breaks = 0
+    last = b"\n"
+    with open(path, 'rb') as audit_trail_csv:
+        for block in iter(lambda: audit_trail_csv.read(_BLOCK_BYTES), b""):
+            line_breaks += block.count(b"\n")
+            last = block[-1:]
+    lines = line_breaks + (last != b"\n")  # the last line may have no line break
+    return max(lines - 1, 0)
+
+
+def _measure(function: Callable[[], object], repeat: int, memory: bool) -> Tuple[float, int]:
+    """
+    Internal function timing a benchmark and measuring its peak memory.
+    :param function: the benchmark
+    :param repeat: the number of timed runs (the fastest is kept)
+    :param memory: measure the peak memory in an extra run? (tracing slows the run down)
+    :return: the best time in seconds, and the peak memory allocated in bytes (0 if not measured)
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    peak = 0
+    if memory:
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return best, peak
+
+
+def _in_memory_benchmarks(path: str, n_rows: int) -> List[Tuple[str, int, Callable[[], object]]]:
+    """
+    Internal function listing the benchmarks of the functions taking data loaded in memory (the
+    descriptions or the DataFrame of the file).
+    """
+    df = pd.read_csv(path, dtype=str, keep_default_na=False)
+    descriptions = [description.strip() for description in df.iloc[:, 5]]
+    return [
+        ("classify_design_space + classify_action_type", n_rows,
+         lambda: [(action_classification.classify_design_space(action),
+                   action_classification.classify_action_type(action))
+                  for action in descriptions]),
+        ("classify", n_rows, lambda: [action_classification.classify(action)
+                                      for action in descriptions]),
+        ("classify_batch", n_rows, lambda: action_classification.classify_batch(df.iloc[:, 5])),
+        ("aggregate_count_frame", n_rows,
+         lambda: aggregate_count.aggregate_count_frame(df, "file", separate_users=True)),
+    ]
+
+
+def _benchmarks(paths: List[str], directory: str, work_dir: str, jobs: int, url: str,
+                max_loaded_rows: int) -> List[Tuple[str, int, Callable[[], object]]]:
+    """
+    Internal function listing the benchmarks: (name, number of rows or plotted users, function).
+    The classifiers and single-file counters run on the first file, the directory counters on
+    every file. The remote counters fetch the first file from url (see page_server). The row-based
+    counters read the file at every run, and the in-memory benchmarks are skipped if the file has
+    more than max_loaded_rows rows, so memory use does not grow with the size of the files.
+    """
+    path = paths[0]
+    n_rows = _count_rows(path)
+    total_rows = sum(_count_rows(other) for other in paths)
+    in_memory = _in_memory_benchmarks(path, n_rows) if n_rows <= max_loaded_rows else []
+    store_path = os.path.join(work_dir, "store")
+    columnar_store.convert_csv(path, store_path)
+    store = columnar_store.load_store(store_path)
+    user_counts = plotting.counts_to_frame(
+        aggregate_count.aggregate_directory(directory, jobs=1, separate_users=True), "User Name")
+    file_counts = user_counts.rename(columns={"User Name": "File Name"})
+    n_users = len(user_counts)
+    # The parallel variants of the counters, unless they would repeat the serial ones
+    parallel = jobs > 1
+    return in_memory + [
+        ("count_design_space", n_rows,
+         lambda: aggregate_count.count_design_space(_stream_rows(path))),
+        ("count_action_type", n_rows,
+         lambda: aggregate_count.count_action_type(_stream_rows(path))),
+        ("aggregate_count", n_rows,
+         lambda: aggregate_count.aggregate_count(_stream_rows(path), "file")),
+        ("aggregate_count (separate_users)", n_rows,
+         lambda: aggregate_count.aggregate_count(_stream_rows(path), "file",
+                                                 separate_users=True)),
+        ("aggregate_breakdown", n_rows,
+         lambda: aggregate_count.aggregate_breakdown(_stream_rows(path), "file",
+                                                     separate_users=True)),
+        ("aggregate_count_stream", n_rows,
+         lambda: aggregate_count.aggregate_count_stream(path, "file", separate_users=True)),
+    ] + ([
+        ("aggregate_count_stream (jobs={})".format(jobs), n_rows,
+         lambda: aggregate_count.aggregate_count_stream(path, "file", separate_users=True,
+                                                        jobs=jobs)),
+    ] if parallel else []) + [
+        ("aggregate_count_store", n_rows,
+         lambda: aggregate_count.aggregate_count_store(store, "file", separate_users=True)),
+        ("aggregate_directory (jobs=1)", total_rows,
+         lambda: aggregate_count.aggregate_directory(directory, jobs=1)),
+    ] + ([
+        ("aggregate_directory (jobs={})".format(jobs), total_rows,
+         lambda: aggregate_count.aggregate_directory(directory, jobs=jobs)),
+    ] if parallel else []) + [
+        ("fetch_count (concurrency=1)", n_rows,
+         lambda: remote_fetch.fetch_count(url, "file", separate_users=True, concurrency=1)),
+        ("fetch_count (concurrency=4)", n_rows,
+         lambda: remote_fetch.fetch_count(url, "file", separate_users=True, concurrency=4)),
+        ("activity_series_store", n_rows,
+         lambda: activity_series.activity_series_store(store, "file")),
+        ("session_summary", n_rows,
+         lambda: sessions.session_summary(_stream_rows(path), "file", separate_users=True)),
+        ("design_space_percentage", n_users,
+         lambda: batch_rendering.render("design_space_percentage", file_counts)),
+        ("action_type_percentage", n_users,
+         lambda: batch_rendering.render("action_type_percentage", file_counts)),
+        ("cr_ratio", n_users, lambda: batch_rendering.render("cr_ratio", file_counts)),
+        ("plot_contribution", n_users,
+         lambda: batch_rendering.render("plot_contribution", user_counts,
+                                        analyzing_category="Total")),
+    ]
+
+
+def run(directory: str, repeat=1, memory=True, jobs=None,
+        max_loaded_rows=MAX_LOADED_ROWS) -> List[Dict]:
+    """
+    Time the classifiers, the counting functions and the plotting functions on the audit trails
+    of a directory (e.g., written with synthetic_audit_trail.generate).
+    :param directory: the directory of the audit trails
+    :param repeat: (Optional) the number of timed runs of each benchmark (the fastest is kept)
+    :param memory: (Optional) also measure the peak memory of each benchmark?
+    :param jobs: (Optional) the number of worker processes of the parallel counters; defaults to
+                    the number of CPUs
+    :param max_loaded_rows: (Optional) the largest file (in rows) loaded in memory for the
+                            in-memory benchmarks (the classifiers and aggregate_count_frame), which
+                            are skipped for larger files
+    :return: one result per benchmark: {"name", "rows", "seconds", "rows_per_second",
+            "peak_bytes"}; for plotting functions, rows are the plotted users
+    """
+    paths = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                   if name.endswith(".csv"))
+    results = []
+    server = page_server.serve_pages(paths[0])
+    url = "http://127.0.0.1:{}/audit_trail".format(server.server_port)
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            for name, rows, function in _benchmarks(paths, directory, work_dir,
+                                                    jobs or os.cpu_count() or 1, url,
+                                                    max_loaded_rows):
+                seconds, peak = _measure(function, repeat, memory)
+                results.append({"name": name, "rows": rows, "seconds": seconds,
+                                "rows_per_second": rows / seconds if seconds else float("inf"),
+                                "peak_bytes": peak})
+    finally:
+        server.shutdown()
+    return results
+
+
+def compare(results: List[Dict], baseline: List[Dict], tolerance=0.2) -> List[str]:
+    """
+    Find the benchmarks whose throughput dropped compared with a baseline run.
+    :param results: the results of run
+    :param baseline: the results of a previous run (e.g., saved with --json)
+    :param tolerance: (Optional) the relative drop of throughput tolerated
+    :return: a description of every regression
+    """
+    previous = {result["name"]: result for result in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get(result["name"])
+        if before and result["rows_per_second"] < before["rows_per_second"] * (1 - tolerance):
+            regressions.append("{}: {:,.0f} rows/s (baseline {:,.0f} rows/s)".format(
+                result["name"], result["rows_per_second"], before["rows_per_second"]))
+    return regressions
+
+
+def main(argv=None) -> int:
+    """
+    Command line entry point (see run_benchmark.py): generate synthetic audit trails, run the
+    benchmarks, print the results and optionally save them or compare them with a baseline.
+    :param argv: (Optional) the command line arguments; defaults to sys.argv[1:]
+    :return: the exit status: 1 if a regression was found, 0 otherwise
+    """
+    parser = argparse.ArgumentParser(description="Benchmark MUCAD-CLF on synthetic audit trails.")
+    parser.add_argument("--rows", type=int, default=100000, help="total number of rows")
+    parser.add_argument("--users", type=int, default=20, help="number of users")
+    parser.add_argument("--files", type=int, default=4, help="number of csv files")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic audit trails")
+    parser.add_argument("--directory", help="keep the synthetic audit trails in this directory")
+    parser.add_argument("--repeat", type=int, default=1, help="timed runs per benchmark")
+    parser.add_argument("--jobs", type=int, help="worker processes of the parallel counters")
+    parser.add_argument("--no-memory", action="store_true", help="skip peak memory measurement")
+    parser.add_argument("--max-loaded-rows", type=int, default=MAX_LOADED_ROWS,
+                        help="skip the in-memory benchmarks for larger files")
+    parser.add_argument("--json", help="save the results in this JSON file")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="relative throughput drop reported as a regression")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        directory = args.directory or temporary_directory
+        synthetic_audit_trail.generate(directory, args.rows, users=args.users, files=args.files,
+                                       seed=args.seed)
+        results = run(directory, repeat=args.repeat, memory=not args.no_memory, jobs=args.jobs,
+                      max_loaded_rows=args.max_loaded_rows)
+
+    print("{:<46}{:>12}{:>12}{:>16}{:>14}".format("Benchmark", "Rows", "Seconds", "Rows/s",
+                                                  "Peak MiB"))
+    for result in results:
+        print("{:<46}{:>12,}{:>12.4f}{:>16,.0f}{:>14.1f}".format(
+            result["name"], result["rows"], result["seconds"], result["rows_per_second"],
+            result["peak_bytes"] / 2 ** 20))
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(results, output, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r') as baseline:
+            regressions = compare(results, json.load(baseline), args.tolerance)
+        for regression in regressions:
+            print("Regression: " + regression)
+        return 1 if regressions else 0
+    return 0
@@ -0,0 +1,83 @@
+import time
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from typing import List, Tuple
+
+# Default number of rows per page served
+PAGE_ROWS = 10000
+
+
+def _paginate(csv_path: str, page_rows: int) -> Tuple[bytes, List[int]]:
+    """
+    Internal function splitting an audit trail file into pages of page_rows rows, without holding
+    the file in memory: the pages are read from the file when they are served.
+    :return: the header of the file, and the byte offsets of the pages followed by the end of the
+            last one
+    """
+    with open(csv_path, 'rb') as audit_trail_csv:
+        header = audit_trail_csv.readline()
+        offsets = [audit_trail_csv.tell()]
+        for row, _ in enumerate(audit_trail_csv, 1):
+            if row % page_rows == 0:
+                offsets.append(audit_trail_csv.tell())
+        end = audit_trail_csv.tell()
+    if end > offsets[-1]:
+        offsets.append(end)
+    return header, offsets
+
+
+def serve_pages(csv_path: str, page_rows=PAGE_ROWS, port=0, latency=0.0, failure_rate=0.0,
+                seed=0) -> ThreadingHTTPServer:
+    """
+    Serve an audit trail file as a paginated export over HTTP, in a background thread, as a local
+    stand-in for an analytics service (e.g., to test or benchmark remote_fetch.fetch_count without
+    a live service). Page n (the "page" query parameter, from 0) is a csv of rows n * page_rows to
+    (n + 1) * page_rows with the header of the file; pages past the end are empty.
+    :param csv_path: the path of the audit trail file
+    :param page_rows: (Optional) the number of rows per page
+    :param port: (Optional) the port to listen on (on localhost); 0 picks a free port
+    :param latency: (Optional) the delay in seconds before every response
+    :param failure_rate: (Optional) the fraction of requests answered with HTTP 503 instead, to
+                            exercise retries
+    :param seed: (Optional) the seed of the failures
+    :return: the running server; its url is "http://127.0.0.1:{server.server_port}/", and it is
+            stopped with server.shutdown()
+    """
+    header, offsets = _paginate(csv_path, page_rows)
+    failures = random.Random(seed)
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive connections
+
+        def do_GET(self) -> None:
+            time.sleep(latency)
+            with lock:
+                failed = failures.random() < failure_rate
+            if failed:
+                self.send_response(503)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            query = parse_qs(urlsplit(self.path).query)
+            number = int(query.get("page", ["0"])[0])
+            body = header
+            if 0 <= number < len(offsets) - 1:
+                with open(csv_path, 'rb') as audit_trail_csv:
+                    audit_trail_csv.seek(offsets[number])
+                    body += audit_trail_csv.read(offsets[number + 1] - offsets[number])
+            self.send_response(200)
+            self.send_header("Content-Type", "text/csv")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args) -> None:
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,133 @@
+import os
+import numpy as np
+import pandas as pd
+from typing import List
+
+# Relative frequencies of the descriptions of Onshape audit trails, estimated from the sample audit
+# trails and completed with the rarer actions used by the classification methods
+DESCRIPTION_WEIGHTS = {
+    "Update Part Metadata": 226, "Start edit of part studio feature": 112,
+    "Commit add or edit of part studio feature": 96, "Add or modify a sketch": 64,
+    "Close document": 40, "Cancel Operation": 40, "Open document": 40,
+    "Add part studio feature": 34, "Update version": 18, "Create version": 18,
+    "Delete part studio feature": 16, "Undo Redo Operation": 2, "Start assembly drag": 2,
+    "Stop assembly drag": 2, "Update workspace units": 2, "Change units": 2, "Copy paste sketch": 2,
+    "Add assembly feature": 4, "Delete assembly feature": 1, "Add assembly instance": 3,
+    "Delete assembly instance": 1, "Start edit of assembly feature": 2, "Set mate values": 2,
+    "Animate action called": 1, "Merge branch": 1, "Branch workspace": 1}
+
+# Families of descriptions naming a feature, with the total frequency of each family
+FEATURE_WEIGHTS = {"Edit : Sketch {}": 50, "Edit : Extrude {}": 10, "Show Sketch {}": 20,
+                   "Hide Sketch {}": 20, "Insert feature : Extrude {}": 12,
+                   "Insert feature : Sketch {}": 8, "Delete : Extrude {}": 6}
+FEATURES_PER_FAMILY = 20
+
+# Tabs of every synthetic document, and the total frequency of each kind of tab event
+TABS = [("Part Studio 1", "PARTSTUDIO"), ("Part Studio 2", "PARTSTUDIO"),
+        ("Assembly 1", "ASSEMBLY"), ("Drawing 1", "DRAWING")]
+TAB_EVENT_WEIGHTS = {"opened": 135, "closed": 135, "created": 3, "deleted": 1, "renamed": 1}
+
+# Descriptions of actions on the whole document, logged with the "N/A" tab
+DOCUMENT_ACTIONS = {"Open document", "Close document", "Create version", "Update version",
+                    "Cancel Operation", "Undo Redo Operation", "Merge branch", "Branch workspace"}
+
+HEADER = ",Event Time,Document,Tab,User,Description\n"
+
+# Number of rows generated and written at a time
+CHUNK_ROWS = 1000000
+
+
+def _vocabulary(users: List[str]):
+    """
+    Internal function listing every distinct description (tab events name the user) with its
+    probability.
+    :param users: the users of the audit trail, as in the User column
+    :return: (descriptions, probabilities of the user-independent descriptions and tab event
+            slots, number of user-independent descriptions, Tab column of each description)
+    """
+    descriptions, weights, tabs = [], [], []
+    for description, weight in DESCRIPTION_WEIGHTS.items():
+        descriptions.append(description)
+        weights.append(weight)
+        tabs.append("N/A" if description in DOCUMENT_ACTIONS else None)
+    for family, weight in FEATURE_WEIGHTS.items():
+        for feature in range(1, FEATURES_PER_FAMILY + 1):
+            descriptions.append(family.format(feature))
+            weights.append(weight / FEATURES_PER_FAMILY)
+            tabs.append(None)
+    n_fixed = len(descriptions)
+    tab_slots = [(tab, tab_type, event) for tab, tab_type in TABS for event in TAB_EVENT_WEIGHTS]
+    weights.extend(TAB_EVENT_WEIGHTS[event] / len(TABS) for _, _, event in tab_slots)
+    for user in users:
+        name = user.split("@")[0].upper()
+        for tab, tab_type, event in tab_slots:
+            descriptions.append("Tab {} of type {} {} by {}".format(tab, tab_type, event, name))
+            tabs.append(tab)
+    probabilities = np.array(weights) / sum(weights)
+    return np.array(descriptions, dtype=object), probabilities, n_fixed, tabs
+
+
+def write_audit_trail(path: str, rows: int, users: List[str], document="Document", seed=0,
+                      start="2021-09-01 00:00:00", mean_gap=20.0) -> None:
+    """
+    Write a synthetic audit trail in the layout of Onshape exports (newest event first), with
+    columns ['Index', 'Event Time', 'Document', 'Tab', 'User', 'Description'].
+    :param path: the path of the csv file to be written
+    :param rows: the number of rows
+    :param users: the e-mail addresses of the users of the audit trail
+    :param document: (Optional) the name of the document
+    :param seed: (Optional) the seed of the random generator, for reproducible audit trails
+    :param start: (Optional) the time of the oldest event
+    :param mean_gap: (Optional) the mean time between two events, in seconds
+    """
+    rng = np.random.default_rng(seed)
+    descriptions, probabilities, n_fixed, tabs = _vocabulary(users)
+    slots_per_user = len(TABS) * len(TAB_EVENT_WEIGHTS)
+    # Tab of each description; actions on a feature happen in a random part studio or assembly
+    tab_of_description = np.array([tab or "" for tab in tabs], dtype=object)
+    feature_tabs = np.array([tab for tab, _ in TABS[:3]], dtype=object)
+    user_array = np.array(users, dtype=object)
+    # Times of the events, from the newest to the oldest
+    newest = np.datetime64(start, "s").astype(np.int64) + int(rows * mean_gap)
+    with open(path, 'w', newline='') as audit_trail_csv:
+        audit_trail_csv.write(HEADER)
+        for first in range(0, rows, CHUNK_ROWS):
+            size = min(CHUNK_ROWS, rows - first)
+            slots = rng.choice(len(probabilities), size=size, p=probabilities)
+            user_codes = rng.integers(0, len(users), size=size)
+            codes = np.where(slots < n_fixed, slots,
+                             n_fixed + user_codes * slots_per_user + slots - n_fixed)
+            tab = tab_of_description[codes]
+            no_tab = tab == ""
+            tab[no_tab] = feature_tabs[rng.integers(0, len(feature_tabs), size=int(no_tab.sum()))]
+            times = newest - np.cumsum(rng.exponential(mean_gap, size=size).astype(np.int64))
+            newest = times[-1] if size else newest
+            event_time = pd.Series(times.astype("datetime64[s]")).dt.strftime("%Y-%m-%d %H:%M:%S")
+            pd.DataFrame({"Index": np.arange(first + 1, first + size + 1), "Event Time": event_time,
+                          "Document": document, "Tab": tab, "User": user_array[user_codes],
+                          "Description": descriptions[codes]}).to_csv(
+                audit_trail_csv, header=False, index=False, lineterminator="\n")
+
+
+def generate(directory: str, rows: int, users=10, files=1, seed=0) -> List[str]:
+    """
+    Write a reproducible set of synthetic audit trails, one document per file. Users are assigned
+    to the files in turn (every file has a single user if files >= users, as in per-student
+    exports), and rows are split evenly between the files.
+    :param directory: the directory of the csv files (created if missing)
+    :param rows: the total number of rows, from 10^3 to 10^8
+    :param users: (Optional) the total number of users
+    :param files: (Optional) the number of files
+    :param seed: (Optional) the seed of the random generator
+    :return: the paths of the csv files
+    """
+    os.makedirs(directory, exist_ok=True)
+    emails = ["user{}@example.com".format(user + 1) for user in range(users)]
+    paths = []
+    for file in range(files):
+        file_users = emails[file::files] or [emails[file % users]]
+        path = os.path.join(directory, "Audit{}.csv".format(file + 1))
+        write_audit_trail(path, rows // files + (file < rows % files), file_users,
+                          document="Document {}".format(file + 1), seed=seed + file)
+        paths.append(path)
+    return paths
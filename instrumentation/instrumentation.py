@@ -0,0 +1,240 @@
+"""
+Opt-in instrumentation of ingestion runs. When enabled (see run), the classification, counting and
+plotting functions record per-stage timers, the number of rows processed by each stage, and a
+histogram of the unclassified descriptions (classified -1 in both classification methods). When
+disabled, which is the default, each instrumented function only checks a module variable.
+The functions run in worker processes through map_workers or submit_worker are instrumented too,
+and their measurements are merged into the run (the seconds of a stage then add up the time spent
+in every process).
+"""
+import json
+import time
+import functools
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+
+class _Report:
+    """
+    Internal accumulator of the measurements of an instrumented run.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}  # stage name -> [seconds, calls, rows]
+        self.unclassified = Counter()
+
+
+class _Stage:
+    """
+    Internal context manager timing one call of a stage; rows can be added while it runs.
+    """
+    __slots__ = ("_totals", "_start", "rows")
+
+    def __init__(self, totals: list, rows: int):
+        self._totals = totals
+        self.rows = rows
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._totals[0] += time.perf_counter() - self._start
+        self._totals[1] += 1
+        self._totals[2] += self.rows
+
+
+_active: Optional[_Report] = None
+_disabled = nullcontext()
+
+
+def enabled() -> bool:
+    """
+    :return: is the instrumentation enabled?
+    """
+    return _active is not None
+
+
+def start() -> None:
+    """
+    Enable the instrumentation, discarding the measurements of any previous run.
+    """
+    global _active
+    _active = _Report()
+
+
+def stop(top_unclassified=100) -> Dict:
+    """
+    Disable the instrumentation.
+    :param top_unclassified: (Optional) the number of most frequent unclassified descriptions
+                                reported
+    :return: the report of the run (see report)
+    """
+    global _active
+    result = report(top_unclassified)
+    _active = None
+    return result
+
+
+def report(top_unclassified=100) -> Dict:
+    """
+    Report the measurements of the current run.
+    :param top_unclassified: (Optional) the number of most frequent unclassified descriptions
+                                reported
+    :return: {"wall_seconds": seconds since the start of the run,
+              "stages": {stage: {"seconds", "calls", "rows", "rows_per_second"}},
+              "unclassified_rows": number of unclassified rows,
+              "unclassified": [[description, rows], ...] from the most frequent}
+    """
+    if _active is None:
+        return {}
+    stages = {}
+    for name, (seconds, calls, rows) in sorted(_active.stages.items(),
+                                               key=lambda item: -item[1][0]):
+        stages[name] = {"seconds": seconds, "calls": calls, "rows": rows,
+                        "rows_per_second": rows / seconds if seconds and rows else None}
+    return {"wall_seconds": time.perf_counter() - _active.start, "stages": stages,
+            "unclassified_rows": sum(_active.unclassified.values()),
+            "unclassified": [list(item)
+                             for item in _active.unclassified.most_common(top_unclassified)]}
+
+
+@contextmanager
+def run(report_path: Optional[str] = None, top_unclassified=100) -> Iterator[None]:
+    """
+    Instrument the code run within the context, e.g.:
+        with instrumentation.run("report.json"):
+            counts = aggregate_count.aggregate_directory(directory, jobs=1)
+    :param report_path: (Optional) if not None, the report is written to this JSON file at the end
+    :param top_unclassified: (Optional) the number of most frequent unclassified descriptions
+                                reported
+    """
+    start()
+    try:
+        yield
+    finally:
+        result = stop(top_unclassified)
+        if report_path:
+            with open(report_path, 'w') as report_json:
+                json.dump(result, report_json, indent=2)
+
+
+def stage(name: str, rows=0):
+    """
+    Time a stage of the run, e.g.:
+        with instrumentation.stage("parse") as timer:
+            ...
+            timer.rows += parsed_rows
+    :param name: the name of the stage
+    :param rows: (Optional) the number of rows processed by the stage
+    :return: a context manager, which does nothing if the instrumentation is disabled
+    """
+    if _active is None:
+        return _disabled
+    return _Stage(_active.stages.setdefault(name, [0.0, 0, 0]), rows)
+
+
+def timed(name: str) -> Callable:
+    """
+    Decorator timing every call of a function as a stage of the run.
+    :param name: the name of the stage
+    """
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return function(*args, **kwargs)
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _WorkerResult:
+    """
+    Internal result of a function run in a worker process, with the measurements of the worker.
+    """
+    __slots__ = ("value", "stages", "unclassified")
+
+    def __init__(self, value: Any, report: _Report):
+        self.value = value
+        self.stages = report.stages
+        self.unclassified = report.unclassified
+
+
+def _run_in_worker(function: Callable, *args) -> _WorkerResult:
+    """
+    Internal function calling a function in a worker process with the instrumentation enabled.
+    """
+    global _active
+    _active = _Report()
+    try:
+        return _WorkerResult(function(*args), _active)
+    finally:
+        _active = None
+
+
+def _collect(result: Any) -> Any:
+    """
+    Internal function merging the measurements of a worker process into the current run.
+    :return: the value returned by the function run in the worker
+    """
+    if not isinstance(result, _WorkerResult):
+        return result
+    if _active is not None:
+        for name, (seconds, calls, rows) in result.stages.items():
+            totals = _active.stages.setdefault(name, [0.0, 0, 0])
+            totals[0] += seconds
+            totals[1] += calls
+            totals[2] += rows
+        _active.unclassified.update(result.unclassified)
+    return result.value
+
+
+def map_workers(executor: Executor, function: Callable, *iterables: Iterable,
+                chunksize=1) -> Iterator:
+    """
+    Same as executor.map, but if the instrumentation is enabled, the calls are instrumented in the
+    worker processes and their measurements are merged into the current run as results arrive.
+    :param executor: the executor (e.g., a ProcessPoolExecutor)
+    :param function: the function to be called (a module-level function, as with executor.map)
+    :param iterables: the arguments of the calls
+    :param chunksize: (Optional) the chunksize of executor.map
+    :return: the results of the calls, in order
+    """
+    if _active is None:
+        return executor.map(function, *iterables, chunksize=chunksize)
+    results = executor.map(functools.partial(_run_in_worker, function), *iterables,
+                           chunksize=chunksize)
+    return (_collect(result) for result in results)
+
+
+def submit_worker(executor: Executor, function: Callable, *args) -> Future:
+    """
+    Same as executor.submit, but if the instrumentation is enabled, the call is instrumented in
+    the worker process; its result must then be read with worker_result.
+    """
+    if _active is None:
+        return executor.submit(function, *args)
+    return executor.submit(_run_in_worker, function, *args)
+
+
+def worker_result(future: Future) -> Any:
+    """
+    Read the result of a call submitted with submit_worker, merging the measurements of the worker
+    process into the current run.
+    :param future: the future returned by submit_worker
+    :return: the value returned by the function
+    """
+    return _collect(future.result())
+
+
+def unclassified_histogram() -> Optional[Counter]:
+    """
+    :return: the histogram of the unclassified descriptions, to be updated by the counting
+            functions, or None if the instrumentation is disabled
+    """
+    return None if _active is None else _active.unclassified
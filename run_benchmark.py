@@ -0,0 +1,14 @@
+import sys
+from benchmarking import benchmark
+
+"""
+Benchmark the classification, counting and plotting functions on reproducible synthetic audit 
+trails, reporting the throughput (rows/s) and the peak memory of each function. 
+Usage examples: 
+        python run_benchmark.py --rows 1000000 --users 200 --files 50
+        python run_benchmark.py --rows 1000000 --json baseline.json
+        python run_benchmark.py --rows 1000000 --baseline baseline.json (exits with status 1 if 
+        the throughput of a function dropped by more than --tolerance)
+"""
+if __name__ == "__main__":
+    sys.exit(benchmark.main())
@@ -0,0 +1,13 @@
+import sys
+from action_counting import watch
+
+"""
+Keep a counts csv up to date while the audit trails of a directory are appended to: only the new 
+rows are counted, and the csv is rewritten atomically at most once every --debounce seconds. 
+Stop with Ctrl+C. 
+Usage examples: 
+        python run_watch.py sample_audit_trails/single_user sample_outputs/Counts.csv
+        python run_watch.py exports Counts.csv --separate-users --debounce 2 --cache counts.db
+"""
+if __name__ == "__main__":
+    sys.exit(watch.main())
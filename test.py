@@ -1,12 +1,8 @@
-import os
 import csv
 import pandas as pd
-from action_counting import aggregate_count
+from action_counting import aggregate_count, deduplication
 from action_count_plotting import plotting
 
-# Store the counts computed for each audit trail file
-counts = {}
-
 # Analyze all files in the "sample_audit_trails/single_user" folder
 directory = "sample_audit_trails/single_user/"  # TODO: locate local directory and modify
 
@@ -18,13 +14,27 @@ separately, or would you like to analyze each CSV file as an aggregate entity.
 2. separate_users = True: analyze each user separately in each CSV file.   
 """
 
-for _, _, files in os.walk(directory):
-    for File in files:
-        if File.endswith(".csv"):
-            with open(directory + File, 'r') as audit_trail_csv:
-                reader = csv.reader(audit_trail_csv)
-                counts = {**counts, **aggregate_count.aggregate_count(
-                    reader, File[:-4], separate_users=separate_users)}
+jobs = 1  # TODO: modify if necessary
+"""
+Number of processes used to count the audit trails in the folder. Use None to use all CPUs (on 
+Windows and macOS, the script must then be run under if __name__ == "__main__":). 
+"""
+
+deduplicate = False  # TODO: modify if necessary
+"""
+If the audit trails in the folder may overlap (e.g., exports of overlapping date ranges, or both 
+per-user and combined exports of the same document), would you like to count every event once? 
+1. deduplicate = False: count every row of every CSV file. 
+2. deduplicate = True: skip the events already counted in another CSV file; with 
+    separate_users = True, the counts of the same user in different CSV files are also merged. 
+"""
+
+if deduplicate:
+    counts = deduplication.aggregate_unique(directory, separate_users=separate_users,
+                                            merge_users=separate_users)
+else:
+    counts = aggregate_count.aggregate_directory(directory, jobs=jobs,
+                                                 separate_users=separate_users)
 
 """
 The following step may be optional for small-scale experiments or testing, whereas print(counts) 
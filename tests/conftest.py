@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The packages of the repository are imported from its root, as in test.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SAMPLE_AUDIT_TRAILS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                   "sample_audit_trails")
@@ -0,0 +1,53 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from action_counting import activity_series, aggregate_count, columnar_store
+from conftest import SAMPLE_AUDIT_TRAILS
+
+COMBINED = os.path.join(SAMPLE_AUDIT_TRAILS, "multi_user", "Combined.csv")
+
+
+def _audit_trail():
+    df = pd.read_csv(COMBINED, dtype=str, keep_default_na=False)
+    df.iloc[::9, 1] = "not a time"
+    return df
+
+
+def _totals(series):
+    return {user: [counts[i].sum(axis=0).tolist() for counts in series.counts]
+            for i, user in enumerate(series.users)}
+
+
+def test_series_sum_to_the_counts_of_the_rows_with_valid_times(tmp_path):
+    df = _audit_trail()
+    valid = columnar_store.event_seconds(df.iloc[:, 1]) != columnar_store.MISSING_TIME
+    expected = aggregate_count.aggregate_count_frame(df[valid], "Combined", separate_users=True)
+    df.to_csv(str(tmp_path / "Combined.csv"), index=False)
+    columnar_store.convert_csv(str(tmp_path / "Combined.csv"), str(tmp_path / "store"))
+    store = columnar_store.load_store(str(tmp_path / "store"))
+    for series in (activity_series.activity_series_frame(df, "Combined", bucket="hour"),
+                   activity_series.activity_series_store(store, "Combined", bucket="hour")):
+        assert {user: count for user, count in _totals(series).items()
+                if any(any(values) for values in count)} == expected
+        assert len(series.bucket_starts) == series.design_space.shape[1]
+
+
+def test_rolling_totals():
+    series = activity_series.activity_series_frame(_audit_trail(), "Combined", bucket="hour")
+    totals = activity_series.rolling_totals(series.action_type, 3)
+    padded = np.pad(series.action_type, ((0, 0), (2, 0), (0, 0)))
+    assert (totals == padded[:, 2:] + padded[:, 1:-1] + padded[:, :-2]).all()
+    with pytest.raises(ValueError):
+        activity_series.rolling_totals(series.action_type, 0)
+
+
+def test_rolling_counter_expires_old_actions():
+    counter = activity_series.RollingCounter(60)
+    counter.add(0, "Create version")
+    counter.add(30, "Cancel Operation")
+    assert counter.add(59, "Unclassified action") == [[0, 0, 0, 0, 0, 2], [0, 0, 0, 1, 0, 1]]
+    # The action at 0 is more than 60 seconds old at 60
+    assert counter.add(60, "Unclassified action") == [[0, 0, 0, 0, 0, 1], [0, 0, 0, 1, 0, 0]]
+    counter.expire(90)
+    assert counter.count == [[0] * 6, [0] * 6]
@@ -0,0 +1,54 @@
+import os
+import pandas as pd
+from action_counting import aggregate_count, audit_index
+from conftest import SAMPLE_AUDIT_TRAILS
+
+COMBINED = os.path.join(SAMPLE_AUDIT_TRAILS, "multi_user", "Combined.csv")
+
+
+def _audit_trail():
+    df = pd.read_csv(COMBINED, dtype=str, keep_default_na=False)
+    # Rows without a valid event time
+    df.iloc[::7, 1] = "not a time"
+    df.iloc[3::11, 1] = ""
+    return df
+
+
+def _sum(counts):
+    total = aggregate_count.new_count()
+    for count in counts:
+        aggregate_count.merge_counts({"": total}, {"": count})
+    return total
+
+
+def test_time_bounds():
+    df = _audit_trail()
+    index = audit_index.index_frame(df, "Combined", separate_users=True)
+    times = pd.to_datetime(df.iloc[:, 1], format="%Y-%m-%d %H:%M:%S", errors="coerce")
+    valid = times.notna()
+    middle = times[valid].sort_values().iloc[len(times[valid]) // 2]
+    assert index.count() == _sum(aggregate_count.aggregate_count_frame(
+        df, "Combined", separate_users=True).values())
+    for start, end, mask in [(middle, None, valid & (times >= middle)),
+                             (None, middle, valid & (times < middle)),
+                             (str(middle), middle + pd.Timedelta(hours=1),
+                              valid & (times >= middle) & (times < middle + pd.Timedelta(hours=1))),
+                             (int(middle.timestamp()), int(middle.timestamp()), ~valid & valid)]:
+        by_user = aggregate_count.aggregate_count_frame(df[mask], "Combined", True)
+        assert index.count(start=start, end=end) == _sum(by_user.values())
+        assert index.count_by("user", start=start, end=end) == \
+            {user: by_user[user] for user in sorted(by_user)}
+
+
+def test_rows_without_a_valid_time_only_match_unbounded_queries():
+    df = _audit_trail()
+    index = audit_index.index_frame(df, "Combined", separate_users=True)
+    valid = pd.to_datetime(df.iloc[:, 1], format="%Y-%m-%d %H:%M:%S", errors="coerce").notna()
+    invalid = aggregate_count.aggregate_count_frame(df[~valid], "Combined", True)
+    assert any(any(count[1]) for count in invalid.values())
+    everything = index.count_by("user")
+    bounded = index.count_by("user", start=0)
+    for user, count in everything.items():
+        missing = invalid.get(user, aggregate_count.new_count())
+        assert [[a - b for a, b in zip(*lists)] for lists in zip(count, missing)] == \
+            bounded.get(user, aggregate_count.new_count())
@@ -0,0 +1,78 @@
+import random
+from collections import Counter, defaultdict
+import pandas as pd
+from action_counting import collaboration
+
+GAP = 5
+
+
+def _audit_trail(seed, rows=400):
+    """
+    Random newest-first rows in 2 documents x 2 tabs by 3 users, with many events in the same
+    second.
+    """
+    generator = random.Random(seed)
+    times = sorted((generator.randrange(300) for _ in range(rows)), reverse=True)
+    return pd.DataFrame({
+        "Index": range(rows),
+        "Event Time": [str(pd.Timestamp("2021-03-01") + pd.Timedelta(seconds=t)) for t in times],
+        "Document": [generator.choice("AB") for _ in range(rows)],
+        "Tab": [generator.choice("xy") for _ in range(rows)],
+        "User": ["u%d@x.com" % generator.randrange(3) for _ in range(rows)],
+        "Description": ["Create version"] * rows})
+
+
+def _brute_force(df):
+    """
+    The overlaps and handoffs of every (document, tab, from user, to user), event by event.
+    """
+    events = defaultdict(list)  # chronological events of every tab, as (time, user)
+    for _, row in df.iloc[::-1].iterrows():
+        events[(row["Document"], row["Tab"])].append(
+            (pd.Timestamp(row["Event Time"]).value // 10 ** 9, "F/" + row["User"].split("@")[0]))
+    table = Counter()
+    for tab, tab_events in events.items():
+        tab_events.sort(key=lambda event: event[0])  # stable: same-second events keep their order
+        for (time, user), (next_time, next_user) in zip(tab_events, tab_events[1:]):
+            if user != next_user and next_time - time <= GAP:
+                table[tab + (user, next_user, "Handoffs")] += 1
+        intervals = defaultdict(list)
+        for time, user in tab_events:
+            if intervals[user] and time - intervals[user][-1][1] <= GAP - 1:
+                intervals[user][-1][1] = time + 1
+            elif not intervals[user] or intervals[user][-1][1] <= time:
+                intervals[user].append([time, time + 1])
+        for user, user_intervals in intervals.items():
+            for other, other_intervals in intervals.items():
+                if user != other:
+                    for start, end in user_intervals:
+                        for other_start, other_end in other_intervals:
+                            overlap = min(end, other_end) - max(start, other_start)
+                            if overlap > 0:
+                                table[tab + (user, other, "Overlap Seconds")] += overlap
+    return table
+
+
+def _table(result):
+    table = Counter()
+    for _, row in result.iterrows():
+        for value in ("Overlap Seconds", "Handoffs"):
+            if row[value]:
+                table[(row["Document"], row["Tab"], row["From User"], row["To User"], value)] += \
+                    row[value]
+    return table
+
+
+def test_matches_brute_force():
+    for seed in range(5):
+        df = _audit_trail(seed)
+        assert _table(collaboration.collaboration_frame(df, "F", gap=GAP)) == _brute_force(df)
+
+
+def test_chronological_order_matches_newest_first():
+    df = _audit_trail(0)
+    newest_first = collaboration.collaboration_frame(df, "F", gap=GAP)
+    chronological = collaboration.collaboration_frame(df.iloc[::-1], "F", gap=GAP,
+                                                      newest_first=False)
+    assert _table(newest_first) == _table(chronological)
+    assert newest_first["Handoffs"].sum() > 0
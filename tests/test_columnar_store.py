@@ -0,0 +1,27 @@
+import pandas as pd
+from action_counting import aggregate_count, columnar_store
+from conftest import SAMPLE_AUDIT_TRAILS
+
+
+def test_round_trip_matches_the_frame_counts(tmp_path):
+    for file_path, file_name in aggregate_count.list_audit_trails(SAMPLE_AUDIT_TRAILS):
+        store_path = str(tmp_path / file_name)
+        columnar_store.convert_csv(file_path, store_path, chunk_rows=100)
+        store = columnar_store.load_store(store_path)
+        df = pd.read_csv(file_path, dtype=str, keep_default_na=False)
+        assert len(store) == len(df)
+        for separate_users in (False, True):
+            assert aggregate_count.aggregate_count_store(store, file_name, separate_users) == \
+                aggregate_count.aggregate_count_frame(df, file_name, separate_users)
+
+
+def test_empty_audit_trail(tmp_path):
+    csv_path = str(tmp_path / "Empty.csv")
+    with open(csv_path, 'w') as audit_trail_csv:
+        audit_trail_csv.write(",Event Time,Document,Tab,User,Description\n")
+    columnar_store.convert_csv(csv_path, str(tmp_path / "store"))
+    store = columnar_store.load_store(str(tmp_path / "store"))
+    assert len(store) == 0 and len(store.descriptions) == 0
+    assert aggregate_count.aggregate_count_store(store, "Empty") == \
+        {"Empty": aggregate_count.new_count()}
+    assert aggregate_count.aggregate_count_store(store, "Empty", separate_users=True) == {}
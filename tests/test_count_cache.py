@@ -0,0 +1,60 @@
+import os
+from action_counting import aggregate_count, count_cache
+from conftest import SAMPLE_AUDIT_TRAILS
+
+COMBINED = os.path.join(SAMPLE_AUDIT_TRAILS, "multi_user", "Combined.csv")
+
+
+def _lines():
+    with open(COMBINED) as audit_trail_csv:
+        return audit_trail_csv.read().splitlines(True)
+
+
+def test_resume_after_partial_row(tmp_path):
+    lines = _lines()
+    audit_trail = tmp_path / "trails" / "Combined.csv"
+    audit_trail.parent.mkdir()
+    audit_trail.write_text("".join(lines[:301]) + lines[301][:20])
+    with count_cache.CountCache(str(tmp_path / "cache.db")) as cache:
+        aggregate_count.aggregate_directory(str(audit_trail.parent), jobs=1, cache=cache)
+        audit_trail.write_text("".join(lines))
+        counts = aggregate_count.aggregate_directory(str(audit_trail.parent), jobs=1,
+                                                     cache=cache)
+    expected = aggregate_count.aggregate_directory(os.path.dirname(COMBINED), jobs=1)
+    assert counts == expected
+
+
+def test_cached_counts_match_uncached(tmp_path):
+    with count_cache.CountCache(str(tmp_path / "cache.db")) as cache:
+        for separate_users in (False, True):
+            expected = aggregate_count.aggregate_directory(SAMPLE_AUDIT_TRAILS, jobs=1,
+                                                           separate_users=separate_users)
+            for _ in range(2):  # counted, then read from the cache
+                assert aggregate_count.aggregate_directory(
+                    SAMPLE_AUDIT_TRAILS, jobs=1, separate_users=separate_users,
+                    cache=cache) == expected
+
+
+def test_empty_file(tmp_path):
+    (tmp_path / "Empty.csv").write_text("")
+    with count_cache.CountCache(str(tmp_path / "cache.db")) as cache:
+        for _ in range(2):
+            counts = aggregate_count.aggregate_directory(str(tmp_path), jobs=1, cache=cache)
+            assert counts == {"Empty": [[0] * 6, [0] * 6]}
+
+
+def test_touched_file_is_hashed_once(tmp_path, monkeypatch):
+    audit_trail = tmp_path / "Combined.csv"
+    audit_trail.write_text("".join(_lines()))
+    hashed = []
+    hash_file = count_cache._hash_file
+    monkeypatch.setattr(count_cache, "_hash_file", lambda *args: hashed.append(args) or
+                        hash_file(*args))
+    with count_cache.CountCache(str(tmp_path / "cache.db")) as cache:
+        expected = aggregate_count.aggregate_directory(str(tmp_path), jobs=1, cache=cache)
+        hashed.clear()
+        os.utime(str(audit_trail), ns=(0, 0))
+        for _ in range(3):
+            assert aggregate_count.aggregate_directory(str(tmp_path), jobs=1,
+                                                       cache=cache) == expected
+    assert len(hashed) == 1
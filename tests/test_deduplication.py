@@ -0,0 +1,37 @@
+import os
+import pandas as pd
+from action_counting import aggregate_count, deduplication
+from conftest import SAMPLE_AUDIT_TRAILS
+
+COMBINED = os.path.join(SAMPLE_AUDIT_TRAILS, "multi_user", "Combined.csv")
+
+HEADER = ",Event Time,Document,Tab,User,Description\n"
+REPEATED = "2021-03-01 10:00:00,Doc,N/A,user1@x.com,Create version\n"
+OTHER = "2021-03-01 10:00:05,Doc,N/A,user1@x.com,Cancel Operation\n"
+
+
+def test_per_user_and_combined_exports_are_counted_once():
+    df = pd.read_csv(COMBINED, dtype=str, keep_default_na=False)
+    assert df.iloc[:, 1:6].duplicated().any()  # the same action repeated within a second
+    expected = aggregate_count.aggregate_count_frame(df, "Combined", separate_users=True)
+    expected = {user.split("/")[1]: count for user, count in expected.items()}
+    for seen in (None, deduplication.BloomFilter(capacity=10000)):
+        counts = deduplication.aggregate_unique(SAMPLE_AUDIT_TRAILS, separate_users=True,
+                                                merge_users=True, seen=seen)
+        assert counts == {user: expected[user] for user in sorted(expected)}
+
+
+def _write(path, rows):
+    with open(path, 'w') as audit_trail_csv:
+        audit_trail_csv.write(HEADER + "".join("%d,%s" % (i, row) for i, row in enumerate(rows)))
+
+
+def test_repeated_events_are_matched_occurrence_by_occurrence(tmp_path):
+    _write(tmp_path / "a.csv", [REPEATED] * 3 + [OTHER])
+    _write(tmp_path / "b.csv", [REPEATED] * 2)
+    _write(tmp_path / "c.csv", [OTHER] + [REPEATED] * 4)
+    counts = deduplication.aggregate_unique(str(tmp_path), chunk_bytes=64)
+    # "Create version" is counted 3 times from a.csv, 0 from b.csv and 1 more from c.csv
+    assert counts["a"] == [[0, 0, 0, 0, 0, 4], [0, 0, 0, 1, 0, 3]]
+    assert counts["b"] == aggregate_count.new_count()
+    assert counts["c"] == [[0, 0, 0, 0, 0, 1], [0, 0, 0, 0, 0, 1]]
@@ -0,0 +1,23 @@
+from action_counting import aggregate_count
+from instrumentation import instrumentation
+from conftest import SAMPLE_AUDIT_TRAILS
+
+
+def test_csv_reader_steps_are_timed_separately():
+    with instrumentation.run():
+        aggregate_count.aggregate_directory(SAMPLE_AUDIT_TRAILS, jobs=1, separate_users=True)
+        report = instrumentation.report()
+    rows = 1218  # the rows of the three sample audit trails
+    for stage in ("parse", "classify", "user keys", "tally"):
+        assert report["stages"][stage]["rows"] == rows
+
+
+def test_worker_processes_are_reported():
+    with instrumentation.run():
+        aggregate_count.aggregate_directory(SAMPLE_AUDIT_TRAILS, jobs=1)
+        serial = instrumentation.report()
+    with instrumentation.run():
+        aggregate_count.aggregate_directory(SAMPLE_AUDIT_TRAILS, jobs=2)
+        parallel = instrumentation.report()
+    assert parallel["stages"]["parse"]["rows"] == serial["stages"]["parse"]["rows"]
+    assert parallel["unclassified"] == serial["unclassified"]
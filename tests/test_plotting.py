@@ -0,0 +1,42 @@
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+from action_count_plotting import plotting
+from action_counting import aggregate_count
+from conftest import SAMPLE_AUDIT_TRAILS
+
+# Users with 1 to 7 actions, in this order: "user_6" has the most
+COUNTS = {"user_{}".format(i): [[i + 1, 0, 0, 0, 0, 0], [i + 1, 0, 0, 0, 0, 0]]
+          for i in range(7)}
+
+
+def test_figures_are_closed(tmp_path):
+    counts = aggregate_count.aggregate_directory(SAMPLE_AUDIT_TRAILS, jobs=1, separate_users=True)
+    counts = {"{}_{}".format(user, i): count for i in range(5) for user, count in counts.items()}
+    plt.close("all")
+    plotting.design_space_percentage(counts, save_fig=str(tmp_path / "design_space"), page_size=4)
+    plotting.cr_ratio(counts)
+    assert plt.get_fignums() == []
+    assert len(list(tmp_path.iterdir())) == 5
+
+
+def test_top_users_and_others():
+    fig, ax = plt.subplots()
+    plotting.design_space_percentage(COUNTS, ax=ax, top_n=3)
+    labels = [label.get_text() for label in ax.get_yticklabels()]
+    plt.close(fig)
+    assert labels == ["user_4", "user_5", "user_6", "Others"]
+    df = plotting._top_users(plotting.counts_to_frame(COUNTS), "File Name",
+                             plotting.COUNT_COLUMNS[:6], 3)
+    assert df["File Name"].tolist() == ["user_4", "user_5", "user_6", "Others"]
+    assert df["Sketching"].tolist() == [5, 6, 7, 1 + 2 + 3 + 4]
+
+
+def test_pages_are_saved_separately(tmp_path):
+    plt.close("all")
+    plotting.action_type_percentage(COUNTS, save_fig=str(tmp_path / "action_type"), top_n=4,
+                                    page_size=2)
+    assert plt.get_fignums() == []
+    # 4 top users and "Others", 2 per page
+    assert sorted(path.name for path in tmp_path.iterdir()) == \
+        ["action_type_1.png", "action_type_2.png", "action_type_3.png"]
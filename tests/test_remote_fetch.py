@@ -0,0 +1,23 @@
+import os
+import pandas as pd
+from action_counting import aggregate_count, remote_fetch
+from benchmarking import page_server
+from instrumentation import instrumentation
+from conftest import SAMPLE_AUDIT_TRAILS
+
+COMBINED = os.path.join(SAMPLE_AUDIT_TRAILS, "multi_user", "Combined.csv")
+
+
+def test_pages_are_counted_in_worker_processes():
+    server = page_server.serve_pages(COMBINED, page_rows=100, failure_rate=0.2)
+    url = "http://127.0.0.1:{}/audit_trail".format(server.server_port)
+    try:
+        with instrumentation.run():
+            counts = remote_fetch.fetch_count(url, "Combined", separate_users=True,
+                                              concurrency=3, backoff=0.01, retries=10, jobs=2)
+            report = instrumentation.report()
+    finally:
+        server.shutdown()
+    df = pd.read_csv(COMBINED, dtype=str, keep_default_na=False)
+    assert counts == aggregate_count.aggregate_count_frame(df, "Combined", separate_users=True)
+    assert report["stages"]["parse"]["rows"] == len(df)
@@ -0,0 +1,41 @@
+import csv
+import os
+import random
+from itertools import groupby
+from action_counting import sessions
+from conftest import SAMPLE_AUDIT_TRAILS
+
+COMBINED = os.path.join(SAMPLE_AUDIT_TRAILS, "multi_user", "Combined.csv")
+
+
+def _rows():
+    with open(COMBINED) as audit_trail_csv:
+        return list(csv.reader(audit_trail_csv))
+
+
+def _summary(rows, newest_first=True):
+    summary = sessions.session_summary(iter(rows), "Combined", separate_users=True,
+                                       newest_first=newest_first)
+    return {user: [round(value, 9) for value in totals] for user, totals in summary.items()}
+
+
+def test_chronological_order_matches_newest_first():
+    rows = _rows()
+    assert _summary(rows) == _summary(rows[:1] + rows[:0:-1], newest_first=False)
+
+
+def test_order_within_a_second_is_ignored():
+    rows = _rows()
+    shuffled = rows[:1]
+    generator = random.Random(0)
+    for _, same_second in groupby(rows[1:], key=lambda row: row[1]):
+        same_second = list(same_second)
+        generator.shuffle(same_second)
+        shuffled.extend(same_second)
+    assert _summary(shuffled) == _summary(rows)
+
+
+def test_invalid_event_times_are_skipped():
+    rows = _rows()
+    invalid = [row[:1] + [time] + row[2:] for row, time in zip(rows[1:3], ["", "not a time"])]
+    assert _summary(rows[:1] + invalid + rows[1:]) == _summary(rows)
@@ -0,0 +1,52 @@
+import csv
+import json
+import os
+import numpy as np
+import pandas as pd
+from action_classification import action_classification, taxonomy
+from action_counting import aggregate_count, audit_index
+from conftest import SAMPLE_AUDIT_TRAILS
+
+COMBINED = os.path.join(SAMPLE_AUDIT_TRAILS, "multi_user", "Combined.csv")
+
+
+def test_composite_codes_are_tallied_with_their_weights(tmp_path):
+    path = tmp_path / "shapes.json"
+    path.write_text(json.dumps({"name": "shapes", "categories": ["A", "B", "C"], "rules": [
+        {"exact": ["ab"], "weights": {"A": 1, "B": -1}},
+        {"exact": ["cc"], "weights": {"C": 2}},
+        {"exact": ["a"], "category": "A"}]}))
+    shapes = taxonomy.load_taxonomy(str(path))
+    matcher = taxonomy.TaxonomyMatcher([shapes])
+    codes, = matcher.classify_batch(np.array(["ab", "cc", "a", "x", "cc"], dtype=object))
+    assert codes.tolist() == [-10, -11, 0, -1, -11]
+    assert shapes.tally(codes).tolist() == [2, -1, 4]
+    assert shapes.tally_by(np.array([0, 1, 1, 0, 0]), 2, codes).tolist() == [[1, -1, 2], [1, 0, 2]]
+    assert shapes.increments(-11) == [(2, 2)]
+
+
+def _count_combined():
+    with open(COMBINED) as audit_trail_csv:
+        return aggregate_count.aggregate_count(csv.reader(audit_trail_csv), "Combined", True)
+
+
+def test_engines_follow_the_taxonomy_weights(monkeypatch):
+    default = _count_combined()
+    design_space, action_type = action_classification.TAXONOMIES
+    # "Add or modify a sketch": +2 sketching, -1 3D features, +1 other organizing
+    monkeypatch.setattr(action_classification, "TAXONOMIES",
+                        [design_space._replace(composite=[(2, -1, 0, 0, 0, 1)]), action_type])
+    action_classification.increments.cache_clear()
+    try:
+        edited = _count_combined()
+        df = pd.read_csv(COMBINED, dtype=str, keep_default_na=False)
+        assert aggregate_count.aggregate_count_frame(df, "Combined", True) == edited
+        assert audit_index.index_frame(df, "Combined", True).count_by() == edited
+    finally:
+        monkeypatch.undo()
+        action_classification.increments.cache_clear()
+    sketches = {user: edited[user][0][5] - default[user][0][5] for user in default}
+    assert any(sketches.values())
+    for user, count in default.items():
+        assert edited[user][0][:2] == [count[0][0] + sketches[user], count[0][1]]
+        assert edited[user][1] == count[1]
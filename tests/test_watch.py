@@ -0,0 +1,35 @@
+import os
+from action_counting import aggregate_count, watch
+
+COUNTS = {"Combined": [[1, 2, 3, 4, 5, 6], [6, 5, 4, 3, 2, 1]]}
+
+
+def test_counts_csv_keeps_its_permissions(tmp_path):
+    output_path = str(tmp_path / "Counts.csv")
+    watch.write_counts_csv(COUNTS, output_path)
+    umask = os.umask(0)
+    os.umask(umask)
+    assert os.stat(output_path).st_mode & 0o777 == 0o666 & ~umask
+    os.chmod(output_path, 0o644)
+    watch.write_counts_csv(COUNTS, output_path)
+    assert os.stat(output_path).st_mode & 0o777 == 0o644
+    with open(output_path) as counts_csv:
+        assert counts_csv.read().splitlines() == [",".join(watch.COUNTS_HEADER),
+                                                  "Combined,1,2,3,4,5,6,6,5,4,3,2,1"]
+
+
+def test_last_row_without_a_line_break_is_counted(tmp_path):
+    path = tmp_path / "a.csv"
+    path.write_text(",Event Time,Document,Tab,User,Description\n"
+                    "1,2021-03-01 10:00:00,Doc,N/A,user1@x.com,Create version\n"
+                    "2,2021-03-01 10:00:05,Doc,N/A,user1@x.com,Cancel Operation")
+    watcher = watch.DirectoryWatcher(str(tmp_path))
+    assert watcher.poll()
+    assert watcher.counts() == aggregate_count.aggregate_directory(str(tmp_path), jobs=1)
+    assert watcher.counts()["a"] == [[0, 0, 0, 0, 0, 2], [0, 0, 0, 1, 0, 1]]
+    # The last row is completed and another one started
+    with open(str(path), 'a') as audit_trail_csv:
+        audit_trail_csv.write("\n3,2021-03-01 10:00:09,Doc,N/A,user1@x.com,Create version")
+    assert watcher.poll()
+    assert watcher.counts() == aggregate_count.aggregate_directory(str(tmp_path), jobs=1)
+    assert watcher.counts()["a"] == [[0, 0, 0, 0, 0, 3], [0, 0, 0, 1, 0, 2]]